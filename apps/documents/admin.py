@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, DocumentTag, DocumentAnalysis
+from .models import AnalysisBackfill, CorpusTerm, Document, DocumentTag, DocumentAnalysis, ExtractedText, UploadSession
 
 
 @admin.register(DocumentTag)
@@ -12,15 +12,15 @@ class DocumentTagAdmin(admin.ModelAdmin):
 class DocumentAnalysisInline(admin.StackedInline):
     model = DocumentAnalysis
     extra = 0
-    readonly_fields = ['analyzed_at', 'updated_at']
+    readonly_fields = ['fingerprint', 'analyzed_at', 'updated_at']
 
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ['title', 'owner', 'visibility', 'analyzed', 'file_size', 'created_at']
-    list_filter = ['visibility', 'analyzed', 'created_at', 'tags']
+    list_display = ['title', 'owner', 'visibility', 'status', 'analyzed', 'file_size', 'created_at']
+    list_filter = ['visibility', 'status', 'analyzed', 'created_at', 'tags']
     search_fields = ['title', 'description', 'owner__email']
-    readonly_fields = ['id', 'file_size', 'page_count', 'created_at', 'updated_at']
+    readonly_fields = ['id', 'file_size', 'content_hash', 'page_count', 'extracted_text', 'created_at', 'updated_at']
     filter_horizontal = ['tags']
     inlines = [DocumentAnalysisInline]
     
@@ -29,10 +29,10 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('id', 'title', 'description', 'owner')
         }),
         ('Fichier', {
-            'fields': ('file', 'file_size', 'page_count', 'snippet')
+            'fields': ('file', 'file_size', 'content_hash', 'page_count', 'snippet', 'extracted_text')
         }),
         ('Configuration', {
-            'fields': ('visibility', 'tags', 'analyzed')
+            'fields': ('visibility', 'tags', 'status', 'analyzed')
         }),
         ('Intégration', {
             'fields': ('mayan_document_id',)
@@ -48,7 +48,36 @@ class DocumentAnalysisAdmin(admin.ModelAdmin):
     list_display = ['document', 'model_used', 'analyzed_at']
     list_filter = ['model_used', 'analyzed_at']
     search_fields = ['document__title', 'summary']
-    readonly_fields = ['analyzed_at', 'updated_at']
+    readonly_fields = ['fingerprint', 'analyzed_at', 'updated_at']
 
 
+@admin.register(ExtractedText)
+class ExtractedTextAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'page_count', 'terms_indexed', 'created_at']
+    search_fields = ['content_hash']
+    readonly_fields = ['content_hash', 'page_count', 'page_offsets', 'terms_indexed', 'created_at']
 
+
+@admin.register(CorpusTerm)
+class CorpusTermAdmin(admin.ModelAdmin):
+    list_display = ['term', 'document_count']
+    search_fields = ['term']
+    readonly_fields = ['term', 'document_count']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'owner', 'status', 'received_size', 'total_size', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['filename', 'owner__email']
+    readonly_fields = ['id', 'received_size', 'document', 'created_at', 'updated_at']
+
+
+@admin.register(AnalysisBackfill)
+class AnalysisBackfillAdmin(admin.ModelAdmin):
+    list_display = ['model_used', 'status', 'scanned_documents', 'total_documents', 'queued_documents', 'created_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = [
+        'id', 'model_used', 'cursor', 'total_documents', 'scanned_documents', 'queued_documents',
+        'created_at', 'updated_at', 'completed_at'
+    ]
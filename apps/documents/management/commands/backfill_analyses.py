@@ -0,0 +1,84 @@
+"""
+Rattrapage des analyses absentes ou périmées après un changement de modèle
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.documents.models import AnalysisBackfill
+from apps.documents.tasks import backfill_analyses_task
+from services.ai_service import ai_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Remet en analyse, par lots et en heures creuses, les documents dont "
+        "l'analyse est absente ou a été faite avec un autre modèle"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            nargs='?',
+            default='status',
+            choices=['start', 'pause', 'resume', 'cancel', 'status', 'run'],
+            help=(
+                "start : démarrer un rattrapage (lots lancés par celery beat) ; "
+                "pause / resume / cancel : suspendre, reprendre ou abandonner le "
+                "rattrapage en cours ; status : progression ; run : lancer un lot "
+                "immédiatement"
+            )
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help="Taille du lot (run, ANALYSIS_BACKFILL_BATCH_SIZE par défaut)"
+        )
+        parser.add_argument(
+            '--ignore-window',
+            action='store_true',
+            help="Lancer le lot même en dehors des plages du rattrapage (run)"
+        )
+    
+    def handle(self, *args, **options):
+        action = options['action']
+        backfill = AnalysisBackfill.get_current()
+        
+        if action == 'start':
+            if backfill:
+                raise CommandError(
+                    f"Un rattrapage est déjà {backfill.get_status_display().lower()} "
+                    f"({backfill.progress}%) : utilisez resume ou cancel"
+                )
+            backfill = AnalysisBackfill.objects.create(
+                model_used=ai_service.model,
+                total_documents=AnalysisBackfill.get_documents().count()
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Rattrapage démarré vers {backfill.model_used} : "
+                f"{backfill.total_documents} document(s) à parcourir"
+            ))
+            return
+        
+        if backfill is None:
+            if action == 'status':
+                self.stdout.write("Aucun rattrapage en cours")
+                return
+            raise CommandError("Aucun rattrapage en cours : utilisez start")
+        
+        if action == 'pause':
+            backfill.set_status(AnalysisBackfill.STATUS_PAUSED)
+        elif action == 'resume':
+            backfill.set_status(AnalysisBackfill.STATUS_RUNNING)
+        elif action == 'cancel':
+            backfill.set_status(AnalysisBackfill.STATUS_CANCELLED)
+        elif action == 'run':
+            if backfill.status != AnalysisBackfill.STATUS_RUNNING:
+                raise CommandError("Le rattrapage est en pause : utilisez resume")
+            queued = backfill_analyses_task(options['batch_size'], options['ignore_window'])
+            self.stdout.write(f"{queued} document(s) remis en analyse")
+            backfill.refresh_from_db()
+        
+        self.stdout.write(
+            f"Rattrapage vers {backfill.model_used} ({backfill.get_status_display().lower()}) : "
+            f"{backfill.scanned_documents}/{backfill.total_documents} document(s) parcouru(s) "
+            f"({backfill.progress}%), {backfill.queued_documents} remis en analyse"
+        )
@@ -0,0 +1,45 @@
+"""
+Passerelle IA : regroupe les requêtes generate de tous les workers
+"""
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from services.ai_gateway import GATEWAY_AVAILABLE, AIGateway
+from services.ai_service import ai_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Démarre la passerelle IA : les workers lui confient leurs requêtes, "
+        "envoyées par lots pour occuper toutes les places des serveurs Ollama"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-batch',
+            type=int,
+            default=settings.OLLAMA_GATEWAY_MAX_BATCH,
+            help="Nombre maximal de requêtes envoyées ensemble"
+        )
+        parser.add_argument(
+            '--max-wait',
+            type=float,
+            default=settings.OLLAMA_GATEWAY_MAX_WAIT,
+            help="Attente maximale (secondes) des requêtes suivantes d'un lot"
+        )
+    
+    def handle(self, *args, **options):
+        if not GATEWAY_AVAILABLE or ai_service.router is None:
+            raise CommandError("Client Ollama ou Redis non installé")
+        
+        gateway = AIGateway(
+            ai_service.router,
+            settings.OLLAMA_GATEWAY_REDIS_URL,
+            max_batch=options['max_batch'],
+            max_wait=options['max_wait'],
+            timeout=ai_service.timeout,
+        )
+        self.stdout.write(f"Passerelle IA : {gateway.concurrency} place(s) Ollama")
+        asyncio.run(gateway.run())
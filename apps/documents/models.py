@@ -1,6 +1,10 @@
+import hashlib
 import uuid
-from django.db import models
+from datetime import timedelta
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 
 
 class DocumentTag(models.Model):
@@ -19,6 +23,156 @@ class DocumentTag(models.Model):
         return self.name
 
 
+class ExtractedText(models.Model):
+    """Texte extrait d'un fichier, partagé par empreinte SHA-256 du contenu"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    content_hash = models.CharField(max_length=64, unique=True, verbose_name='Empreinte SHA-256')
+    text = models.TextField(blank=True, verbose_name='Texte')
+    text_hash = models.CharField(max_length=64, blank=True, default='', verbose_name='Empreinte SHA-256 du texte')
+    page_count = models.IntegerField(default=0, verbose_name='Nombre de pages')
+    page_offsets = models.JSONField(default=list, verbose_name='Position des pages')
+    terms_indexed = models.BooleanField(default=False, verbose_name='Pris en compte dans le corpus')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Extrait le')
+    
+    class Meta:
+        verbose_name = 'Texte extrait'
+        verbose_name_plural = 'Textes extraits'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return self.content_hash
+    
+    def save(self, *args, **kwargs):
+        # Empreinte du texte tenue à jour : comparée sans relire le texte
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.text_hash = self.compute_text_hash(self.text)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'text_hash'}
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def compute_text_hash(text):
+        """Empreinte SHA-256 d'un texte, aux espaces de début et de fin près"""
+        return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+    
+    def get_text_hash(self):
+        """Empreinte du texte, calculée et enregistrée si le texte a été extrait avant son ajout"""
+        if not self.text_hash:
+            self.text_hash = self.compute_text_hash(self.text)
+            ExtractedText.objects.filter(pk=self.pk).update(text_hash=self.text_hash)
+        return self.text_hash
+    
+    @classmethod
+    def get_or_extract(cls, file_path, content_hash=None):
+        """
+        Récupère le texte extrait d'un fichier, en ne l'extrayant qu'au premier appel
+        
+        Args:
+            file_path: Chemin vers le fichier
+            content_hash: Empreinte SHA-256 du fichier si déjà connue
+            
+        Returns:
+            Instance ExtractedText
+        """
+        from services.file_service import FileService
+        
+        if content_hash is None:
+            content_hash = FileService.compute_file_hash(file_path)
+        
+        extracted = cls.objects.filter(content_hash=content_hash).first()
+        if extracted:
+            return extracted
+        
+        result = FileService.extract_document(file_path)
+        extracted, _ = cls.objects.get_or_create(
+            content_hash=content_hash,
+            defaults=result
+        )
+        return extracted
+    
+    def index_terms(self):
+        """Ajoute les termes de ce texte aux fréquences documentaires du corpus (une seule fois)"""
+        from services.keyword_service import KeywordService
+        
+        with transaction.atomic():
+            # Le drapeau garantit qu'un texte n'est compté qu'une fois
+            updated = ExtractedText.objects.filter(pk=self.pk, terms_indexed=False).update(terms_indexed=True)
+            if not updated:
+                return
+            CorpusTerm.add_document(KeywordService.get_terms(self.text))
+        self.terms_indexed = True
+    
+    def get_local_keywords(self, num_keywords=7):
+        """
+        Mots-clés calculés localement (BM25 sur le corpus), sans appel au modèle
+        
+        Args:
+            num_keywords: Nombre de mots-clés à extraire
+            
+        Returns:
+            Liste de mots-clés
+        """
+        from services.keyword_service import KeywordService
+        
+        self.index_terms()
+        term_counts = KeywordService.get_terms(self.text)
+        return KeywordService.extract_keywords(
+            term_counts,
+            CorpusTerm.get_frequencies(term_counts),
+            ExtractedText.objects.filter(terms_indexed=True).count(),
+            num_keywords
+        )
+
+
+class CorpusTerm(models.Model):
+    """Nombre de textes extraits contenant un terme, tenu à jour à chaque ingestion"""
+    term = models.CharField(max_length=100, unique=True, verbose_name='Terme')
+    document_count = models.IntegerField(default=0, verbose_name='Nombre de documents')
+    
+    # Nombre de termes par requête (limite de paramètres des bases de données)
+    BATCH_SIZE = 500
+    
+    class Meta:
+        verbose_name = 'Terme du corpus'
+        verbose_name_plural = 'Termes du corpus'
+        ordering = ['-document_count']
+    
+    def __str__(self):
+        return self.term
+    
+    @classmethod
+    def add_document(cls, terms):
+        """
+        Incrémente la fréquence documentaire des termes d'un nouveau document
+        
+        Args:
+            terms: Termes distincts du document
+        """
+        terms = [term for term in set(terms) if len(term) <= 100]
+        for start in range(0, len(terms), cls.BATCH_SIZE):
+            batch = terms[start:start + cls.BATCH_SIZE]
+            cls.objects.bulk_create([cls(term=term) for term in batch], ignore_conflicts=True)
+            cls.objects.filter(term__in=batch).update(document_count=F('document_count') + 1)
+    
+    @classmethod
+    def get_frequencies(cls, terms):
+        """
+        Fréquences documentaires d'un ensemble de termes
+        
+        Returns:
+            Dict terme -> nombre de documents le contenant
+        """
+        terms = list(terms)
+        frequencies = {}
+        for start in range(0, len(terms), cls.BATCH_SIZE):
+            frequencies.update(
+                cls.objects.filter(term__in=terms[start:start + cls.BATCH_SIZE])
+                .values_list('term', 'document_count')
+            )
+        return frequencies
+
+
 class Document(models.Model):
     """Modèle principal pour les documents"""
     
@@ -28,11 +182,35 @@ class Document(models.Model):
         ('PUBLIC', 'Public'),
     ]
     
+    STATUS_PENDING = 'pending'
+    STATUS_EXTRACTING = 'extracting'
+    STATUS_QUEUED = 'queued'
+    STATUS_DEFERRED = 'deferred'
+    STATUS_ANALYZING = 'analyzing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_EXTRACTING, 'Extraction en cours'),
+        (STATUS_QUEUED, "En file d'attente d'analyse"),
+        (STATUS_DEFERRED, 'Analyse reportée aux heures creuses'),
+        (STATUS_ANALYZING, 'Analyse en cours'),
+        (STATUS_READY, 'Prêt'),
+        (STATUS_FAILED, 'Échec'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255, verbose_name='Titre')
     description = models.TextField(blank=True, verbose_name='Description')
     file = models.FileField(upload_to='documents/%Y/%m/', verbose_name='Fichier')
     file_size = models.BigIntegerField(default=0, verbose_name='Taille du fichier')
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        verbose_name='Empreinte SHA-256'
+    )
     page_count = models.IntegerField(default=0, verbose_name='Nombre de pages')
     
     owner = models.ForeignKey(
@@ -56,6 +234,21 @@ class Document(models.Model):
         verbose_name='Tags'
     )
     
+    extracted_text = models.ForeignKey(
+        ExtractedText,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='documents',
+        verbose_name='Texte extrait'
+    )
+    
+    status = models.CharField(
+        max_length=15,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="Statut d'ingestion"
+    )
     analyzed = models.BooleanField(default=False, verbose_name='Analysé')
     snippet = models.TextField(blank=True, verbose_name='Extrait')
     mayan_document_id = models.CharField(
@@ -76,17 +269,51 @@ class Document(models.Model):
             models.Index(fields=['-created_at']),
             models.Index(fields=['owner']),
             models.Index(fields=['visibility']),
+            models.Index(fields=['status']),
         ]
     
     def __str__(self):
         return self.title
     
+    def set_status(self, status):
+        """Met à jour le statut d'ingestion sans réécrire les autres champs"""
+        self.status = status
+        Document.objects.filter(pk=self.pk).update(status=status)
+    
     @property
     def file_url(self):
         """URL complète du fichier"""
         if self.file:
             return self.file.url
         return None
+    
+    def get_extracted_text(self):
+        """
+        Texte extrait du fichier, extrait puis mémorisé au premier appel
+        
+        Returns:
+            Instance ExtractedText
+        """
+        if self.extracted_text is None:
+            self.extracted_text = ExtractedText.get_or_extract(
+                self.file.path,
+                content_hash=self.content_hash or None
+            )
+            self.save(update_fields=['extracted_text'])
+        return self.extracted_text
+    
+    @classmethod
+    def find_by_content_hash(cls, content_hash):
+        """Document existant dont le fichier stocké a ce contenu, ou None"""
+        if not content_hash:
+            return None
+        return cls.objects.filter(content_hash=content_hash).exclude(file='').first()
+    
+    def is_file_shared(self):
+        """Vérifie si d'autres documents référencent le même fichier stocké"""
+        if not self.file:
+            return False
+        return Document.objects.filter(file=self.file.name).exclude(pk=self.pk).exists()
 
 
 class DocumentAnalysis(models.Model):
@@ -101,6 +328,12 @@ class DocumentAnalysis(models.Model):
     summary = models.TextField(verbose_name='Résumé')
     key_points = models.JSONField(default=list, verbose_name='Points clés')
     model_used = models.CharField(max_length=100, verbose_name='Modèle utilisé')
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        verbose_name="Empreinte des entrées de l'analyse"
+    )
     analyzed_at = models.DateTimeField(auto_now_add=True, verbose_name='Analysé le')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')
     
@@ -111,6 +344,204 @@ class DocumentAnalysis(models.Model):
     
     def __str__(self):
         return f"Analyse de {self.document.title}"
+    
+    @classmethod
+    def find_shared(cls, document, fingerprint):
+        """
+        Analyse existante d'un autre document de même empreinte d'analyse
+        (même texte, même modèle, mêmes prompts et options)
+        
+        Args:
+            document: Document à analyser
+            fingerprint: Empreinte des entrées de l'analyse
+            
+        Returns:
+            Instance DocumentAnalysis ou None
+        """
+        return cls.objects.filter(fingerprint=fingerprint).exclude(document=document).first()
+    
+    def share_with(self, document):
+        """
+        Réutilise cette analyse pour un autre document, sans nouvel appel au modèle
+        
+        Returns:
+            Instance DocumentAnalysis du document cible
+        """
+        analysis, _ = DocumentAnalysis.objects.update_or_create(
+            document=document,
+            defaults={
+                'summary': self.summary,
+                'key_points': self.key_points,
+                'model_used': self.model_used,
+                'fingerprint': self.fingerprint,
+            }
+        )
+        document.analyzed = True
+        document.status = Document.STATUS_READY
+        document.save(update_fields=['analyzed', 'status'])
+        return analysis
 
 
+class AnalysisBackfill(models.Model):
+    """
+    Rattrapage des analyses absentes ou périmées (changement de modèle, de
+    prompts ou d'options), mené par lots en heures creuses
+    
+    Les documents sont parcourus dans l'ordre de leur ID ; le curseur est
+    enregistré après chaque lot : un rattrapage interrompu ou mis en pause
+    reprend là où il s'était arrêté.
+    """
+    
+    STATUS_RUNNING = 'running'
+    STATUS_PAUSED = 'paused'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CANCELLED = 'cancelled'
+    
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_PAUSED, 'En pause'),
+        (STATUS_COMPLETED, 'Terminé'),
+        (STATUS_CANCELLED, 'Annulé'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_RUNNING,
+        verbose_name='Statut'
+    )
+    model_used = models.CharField(max_length=100, verbose_name='Modèle cible')
+    cursor = models.UUIDField(null=True, blank=True, verbose_name='Dernier document parcouru')
+    total_documents = models.IntegerField(default=0, verbose_name='Documents à parcourir')
+    scanned_documents = models.IntegerField(default=0, verbose_name='Documents parcourus')
+    queued_documents = models.IntegerField(default=0, verbose_name='Documents remis en analyse')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Créé le')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name='Terminé le')
+    
+    class Meta:
+        verbose_name = "Rattrapage d'analyses"
+        verbose_name_plural = "Rattrapages d'analyses"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Rattrapage {self.model_used} ({self.scanned_documents}/{self.total_documents})"
+    
+    @classmethod
+    def get_current(cls):
+        """Rattrapage en cours ou en pause, None si aucun"""
+        return cls.objects.filter(status__in=[cls.STATUS_RUNNING, cls.STATUS_PAUSED]).first()
+    
+    @staticmethod
+    def get_documents():
+        """Documents concernés : analyse terminée ou échouée, texte déjà extrait"""
+        return Document.objects.filter(
+            status__in=[Document.STATUS_READY, Document.STATUS_FAILED],
+            extracted_text__isnull=False
+        )
+    
+    def get_remaining_documents(self):
+        """
+        Documents restant à parcourir, dans l'ordre du parcours
+        
+        Le texte extrait n'est pas chargé : son empreinte suffit pour
+        repérer les analyses périmées.
+        """
+        documents = self.get_documents()
+        if self.cursor:
+            documents = documents.filter(id__gt=self.cursor)
+        return documents.select_related('analysis', 'extracted_text').defer(
+            'extracted_text__text', 'extracted_text__page_offsets'
+        ).order_by('id')
+    
+    def set_status(self, status):
+        """Met à jour le statut sans réécrire la progression"""
+        self.status = status
+        if status == self.STATUS_COMPLETED:
+            self.completed_at = timezone.now()
+        AnalysisBackfill.objects.filter(pk=self.pk).update(
+            status=status, completed_at=self.completed_at, updated_at=timezone.now()
+        )
+    
+    @property
+    def progress(self):
+        """Part des documents parcourus (en %)"""
+        if not self.total_documents:
+            return 100
+        return min(100, round(100 * self.scanned_documents / self.total_documents))
+
 
+class UploadSession(models.Model):
+    """Upload par morceaux en cours, pouvant être repris après une coupure"""
+    
+    STATUS_ACTIVE = 'active'
+    STATUS_FINALIZING = 'finalizing'
+    STATUS_COMPLETED = 'completed'
+    
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'En cours'),
+        (STATUS_FINALIZING, 'En finalisation'),
+        (STATUS_COMPLETED, 'Terminé'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+        verbose_name='Propriétaire'
+    )
+    filename = models.CharField(max_length=255, verbose_name='Nom du fichier')
+    total_size = models.BigIntegerField(verbose_name='Taille totale')
+    chunk_size = models.IntegerField(verbose_name='Taille des morceaux')
+    received_size = models.BigIntegerField(default=0, verbose_name='Octets reçus')
+    metadata = models.JSONField(default=dict, verbose_name='Métadonnées du document')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_ACTIVE,
+        verbose_name='Statut'
+    )
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload_sessions',
+        verbose_name='Document'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Créé le')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Modifié le')
+    
+    class Meta:
+        verbose_name = 'Upload par morceaux'
+        verbose_name_plural = 'Uploads par morceaux'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size})"
+    
+    @property
+    def next_chunk(self):
+        """Numéro du prochain morceau attendu"""
+        return self.received_size // self.chunk_size
+    
+    @property
+    def is_complete(self):
+        """Vérifie si tous les octets ont été reçus"""
+        return self.received_size == self.total_size
+    
+    @property
+    def expires_at(self):
+        """Date d'abandon de l'upload faute de nouveau morceau"""
+        if self.status == self.STATUS_COMPLETED:
+            return None
+        return self.updated_at + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    
+    @classmethod
+    def get_expired(cls):
+        """Uploads inachevés sans nouveau morceau depuis UPLOAD_SESSION_TTL_HOURS heures"""
+        return cls.objects.exclude(status=cls.STATUS_COMPLETED).filter(
+            updated_at__lt=timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+        )
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Document, DocumentTag, DocumentAnalysis
+from .models import Document, DocumentTag, DocumentAnalysis, UploadSession
 from apps.accounts.serializers import UserSerializer
 
 
@@ -32,12 +32,12 @@ class DocumentSerializer(serializers.ModelSerializer):
         model = Document
         fields = [
             'id', 'title', 'description', 'file', 'file_url', 'file_size',
-            'page_count', 'owner', 'visibility', 'analyzed', 'tags',
+            'page_count', 'owner', 'visibility', 'status', 'analyzed', 'tags',
             'analysis', 'snippet', 'mayan_document_id',
             'created_at', 'updated_at'
         ]
         read_only_fields = [
-            'id', 'owner', 'file_size', 'page_count', 'analyzed',
+            'id', 'owner', 'file_size', 'page_count', 'status', 'analyzed',
             'snippet', 'mayan_document_id', 'created_at', 'updated_at'
         ]
     
@@ -63,10 +63,20 @@ class DocumentCreateSerializer(serializers.ModelSerializer):
         fields = ['title', 'description', 'file', 'visibility', 'tags']
     
     def create(self, validated_data):
+        from services.file_service import FileService
+        
         tags_data = validated_data.pop('tags', [])
         
-        # Créer le document
-        document = Document.objects.create(**validated_data)
+        # Empreinte du contenu, calculée pendant l'upload
+        content_hash = FileService.compute_upload_hash(validated_data['file'])
+        duplicate = Document.find_by_content_hash(content_hash)
+        
+        # Contenu déjà stocké : référencer le fichier existant au lieu de le dupliquer
+        if duplicate:
+            validated_data['file'] = duplicate.file.name
+        
+        # Créer le document (extraction et analyse faites par Celery)
+        document = Document.objects.create(content_hash=content_hash, **validated_data)
         
         # Ajouter les tags
         for tag_name in tags_data:
@@ -76,22 +86,6 @@ class DocumentCreateSerializer(serializers.ModelSerializer):
             )
             document.tags.add(tag)
         
-        # Extraire les infos du fichier
-        from services.file_service import FileService
-        
-        file_path = document.file.path
-        file_info = FileService.get_file_info(file_path)
-        
-        document.file_size = file_info['size']
-        document.page_count = file_info['page_count']
-        
-        # Extraire un snippet
-        text = FileService.extract_text(file_path)
-        if text:
-            document.snippet = FileService.generate_snippet(text)
-        
-        document.save()
-        
         return document
 
 
@@ -138,7 +132,7 @@ class DocumentListSerializer(serializers.ModelSerializer):
         model = Document
         fields = [
             'id', 'title', 'description', 'file_size', 'page_count',
-            'owner', 'visibility', 'analyzed', 'has_analysis', 'tags',
+            'owner', 'visibility', 'status', 'analyzed', 'has_analysis', 'tags',
             'snippet', 'created_at', 'updated_at'
         ]
     
@@ -146,4 +140,53 @@ class DocumentListSerializer(serializers.ModelSerializer):
         return hasattr(obj, 'analysis')
 
 
+class UploadSessionCreateSerializer(serializers.Serializer):
+    """Serializer pour l'initialisation d'un upload par morceaux"""
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True)
+    visibility = serializers.ChoiceField(choices=Document.VISIBILITY_CHOICES, required=False)
+    tags = serializers.ListField(
+        child=serializers.CharField(),
+        required=False
+    )
+    
+    def validate(self, attrs):
+        from services.file_service import FileService
+        
+        # Rejeter les fichiers trop gros ou non supportés avant tout transfert
+        is_valid, error = FileService.validate_file_metadata(attrs['filename'], attrs['size'])
+        if not is_valid:
+            raise serializers.ValidationError(error)
+        return attrs
+    
+    def create(self, validated_data):
+        from django.conf import settings
+        
+        filename = validated_data.pop('filename')
+        size = validated_data.pop('size')
+        
+        return UploadSession.objects.create(
+            owner=validated_data.pop('owner'),
+            filename=filename,
+            total_size=size,
+            chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+            metadata=validated_data,
+        )
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer pour l'état d'un upload par morceaux"""
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'total_size', 'chunk_size', 'received_size',
+            'next_chunk', 'status', 'document', 'created_at', 'updated_at',
+            'expires_at'
+        ]
+        read_only_fields = fields
+
+
 
@@ -1,78 +1,436 @@
 """
-Tâches Celery pour l'analyse asynchrone des documents
+Tâches Celery pour l'ingestion et l'analyse asynchrones des documents
 """
 import logging
-from celery import shared_task
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from celery import Task, chain, shared_task, states
+from celery.schedules import crontab_parser
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.storage import default_storage
+from django.utils import timezone
 
+from services.admission_service import AdmissionService
 from services.ai_service import ai_service
 from services.file_service import FileService
+from services.upload_service import UploadService
 
 logger = logging.getLogger(__name__)
 
+# Temps réservé, avant la limite de la tâche, à l'enregistrement du résultat
+DEADLINE_MARGIN = 15
 
-@shared_task(bind=True, max_retries=3)
-def analyze_document_task(self, document_id: str):
+# Verrou (cache Redis) portant l'ID de la tâche d'analyse en cours d'un document
+ANALYSIS_LOCK_KEY = 'documents:analysis-task:{}'
+
+# Verrou du répartiteur des analyses de masse
+BULK_DISPATCH_LOCK_KEY = 'documents:bulk-dispatch'
+
+# Verrou du rattrapage des analyses périmées, et nombre de documents lus
+# par requête lors du parcours
+BACKFILL_LOCK_KEY = 'documents:analysis-backfill'
+BACKFILL_SCAN_SIZE = 200
+
+# Résultats intermédiaires d'une analyse, par empreinte (voir get_analysis_fingerprint)
+ANALYSIS_CHECKPOINT_KEY = 'documents:analysis-checkpoint:{}'
+
+# Document analysé, par ID d'analyse (contrôle d'accès au suivi de l'analyse)
+ANALYSIS_DOCUMENT_KEY = 'documents:analysis-document:{}'
+
+# Dernière étape franchie, par ID d'analyse : reprise pendant une nouvelle
+# tentative de l'étape suivante (état RETRY ou STARTED dans le backend)
+ANALYSIS_STAGE_KEY = 'documents:analysis-stage:{}'
+
+# Suivi d'une analyse dans le backend de résultats Celery : état
+# intermédiaire et étapes franchies, dans l'ordre
+ANALYSIS_PROGRESS_STATE = 'PROGRESS'
+STAGE_QUEUED = 'queued'
+STAGE_EXTRACTED = 'extracted'
+STAGE_SUMMARIZED = 'summarized'
+STAGE_KEYWORDS = 'keywords'
+STAGE_SAVED = 'saved'
+ANALYSIS_STAGE_ORDER = [STAGE_QUEUED, STAGE_EXTRACTED, STAGE_SUMMARIZED, STAGE_KEYWORDS, STAGE_SAVED]
+
+# Nouvelles tentatives des étapes de l'analyse : délai exponentiel
+# (retry_backoff, puis 2x, 4x...) plafonné à retry_backoff_max, avec gigue
+# aléatoire pour ne pas relancer en même temps les tâches tombées ensemble
+EXTRACTION_RETRY_POLICY = {
+    'autoretry_for': (Exception,),
+    'dont_autoretry_for': (ObjectDoesNotExist,),
+    'max_retries': 3,
+    'retry_backoff': 5,
+    'retry_backoff_max': 60,
+    'retry_jitter': True,
+}
+LLM_RETRY_POLICY = {
+    'autoretry_for': (Exception,),
+    'dont_autoretry_for': (ObjectDoesNotExist,),
+    'max_retries': 5,
+    'retry_backoff': 15,
+    'retry_backoff_max': 300,
+    'retry_jitter': True,
+}
+
+
+def get_task_deadline(task) -> Optional[float]:
+    """
+    Échéance des appels IA d'une tâche, déduite de sa limite de temps
+    
+    Args:
+        task: Tâche Celery liée (bind=True) en cours d'exécution
+        
+    Returns:
+        Échéance absolue (time.monotonic()), ou None si la tâche n'a pas de limite
+    """
+    soft_limit = (task.request.timelimit or (None, None))[1] or task.soft_time_limit
+    if not soft_limit:
+        return None
+    return time.monotonic() + max(soft_limit - DEADLINE_MARGIN, 1)
+
+
+def get_analysis_lock_timeout() -> int:
+    """Durée de vie du verrou d'analyse : toutes les tentatives de toutes les étapes (secondes)"""
+    return sum(
+        ((stage.time_limit or DEADLINE_MARGIN * 2) + stage.retry_backoff_max) * (stage.max_retries + 1)
+        for stage in ANALYSIS_STAGES
+    )
+
+
+def acquire_analysis_lock(document_id: str, task_id: str) -> bool:
+    """
+    Réserve l'analyse d'un document pour une tâche
+    
+    Returns:
+        True si le verrou est pris par cette tâche (ou l'était déjà)
+    """
+    key = ANALYSIS_LOCK_KEY.format(document_id)
+    return cache.add(key, task_id, get_analysis_lock_timeout()) or cache.get(key) == task_id
+
+
+def release_analysis_lock(document_id: str, task_id: str):
+    """Libère le verrou d'analyse d'un document s'il appartient à cette tâche"""
+    key = ANALYSIS_LOCK_KEY.format(document_id)
+    if cache.get(key) == task_id:
+        cache.delete(key)
+
+
+def enqueue_analysis(document_id: str, force: bool = False, bulk: bool = False) -> Tuple[str, bool]:
+    """
+    Lance l'analyse d'un document, sauf si une analyse est déjà en cours
+    
+    Le verrou du document est pris avant l'envoi de la chaîne d'analyse,
+    au nom de sa dernière étape.
+    
+    Args:
+        document_id: ID du document à analyser
+        force: Refaire l'analyse même si elle est à jour
+        bulk: Analyse de masse (file LLM de masse, traitée après la file
+            interactive)
+        
+    Returns:
+        Tuple (ID de la tâche, True si une nouvelle tâche a été lancée) ;
+        si une analyse est déjà en cours, l'ID de sa tâche
+    """
+    key = ANALYSIS_LOCK_KEY.format(document_id)
+    task_id = str(uuid.uuid4())
+    
+    while not cache.add(key, task_id, get_analysis_lock_timeout()):
+        running_task_id = cache.get(key)
+        if running_task_id:
+            return running_task_id, False
+        # Verrou libéré entre-temps : nouvel essai
+    
+    cache.set(ANALYSIS_DOCUMENT_KEY.format(task_id), str(document_id), get_analysis_status_timeout())
+    report_analysis_progress(str(document_id), task_id, STAGE_QUEUED)
+    build_analysis_pipeline(document_id, force, task_id, bulk=bulk).apply_async()
+    return task_id, True
+
+
+def get_analysis_status_timeout() -> int:
+    """Durée de conservation du suivi d'une analyse : celle des résultats Celery (secondes)"""
+    return int(save_analysis_task.app.conf.result_expires.total_seconds())
+
+
+def report_analysis_progress(document_id: str, pipeline_id: str, stage: str):
     """
-    Tâche asynchrone pour analyser un document avec l'IA
+    Publie l'étape franchie par une analyse dans le backend de résultats
+    
+    L'état est enregistré sous l'ID de l'analyse (celui de sa dernière
+    étape), puis remplacé par le résultat final à la fin de l'analyse.
+    L'étape est aussi conservée à part, l'état du backend étant remplacé
+    par RETRY ou STARTED pendant l'exécution de la dernière étape.
+    """
+    cache.set(ANALYSIS_STAGE_KEY.format(pipeline_id), stage, get_analysis_status_timeout())
+    save_analysis_task.backend.store_result(
+        pipeline_id,
+        {'document_id': document_id, 'stage': stage},
+        ANALYSIS_PROGRESS_STATE
+    )
+
+
+def get_analysis_status(task_id: str) -> Optional[Dict]:
+    """
+    Avancement d'une analyse, lu dans le backend de résultats Celery
+    
+    Args:
+        task_id: ID de l'analyse (renvoyé par enqueue_analysis)
+        
+    Returns:
+        Dict avec task_id, document_id, state (état Celery : PROGRESS,
+        SUCCESS, FAILURE...), stage (dernière étape franchie, None en cas
+        d'échec), progress et total (étapes franchies / nombre d'étapes),
+        result (analyse terminée) ou error (analyse en échec) ; None si
+        l'analyse est inconnue ou expirée
+    """
+    document_id = cache.get(ANALYSIS_DOCUMENT_KEY.format(task_id))
+    if document_id is None:
+        return None
+    
+    result = save_analysis_task.AsyncResult(task_id)
+    if result.state == ANALYSIS_PROGRESS_STATE:
+        stage = result.info.get('stage', STAGE_QUEUED)
+    elif result.state == states.SUCCESS:
+        stage = STAGE_SAVED
+    elif result.state == states.FAILURE:
+        stage = None
+    else:
+        # PENDING, STARTED, RETRY : dernière étape publiée
+        stage = cache.get(ANALYSIS_STAGE_KEY.format(task_id), STAGE_QUEUED)
+    
+    status = {
+        'task_id': task_id,
+        'document_id': document_id,
+        'state': result.state,
+        'stage': stage,
+        'progress': None if stage is None else ANALYSIS_STAGE_ORDER.index(stage),
+        'total': len(ANALYSIS_STAGE_ORDER) - 1,
+    }
+    if result.state == states.SUCCESS:
+        status['result'] = result.result
+    elif result.state == states.FAILURE:
+        status['error'] = str(result.result)
+    return status
+
+
+def queue_bulk_analysis(document_id: str, deferred: bool = False):
+    """
+    Met un document en file d'attente d'analyse de masse
+    
+    Les documents en attente sont lancés par dispatch_bulk_analyses_task,
+    au rythme des places libres des serveurs Ollama et à tour de rôle entre
+    propriétaires.
+    
+    Args:
+        document_id: ID du document à analyser
+        deferred: N'analyser le document qu'en dehors des heures ouvrées
+    """
+    from apps.documents.models import Document
+    
+    status = Document.STATUS_DEFERRED if deferred else Document.STATUS_QUEUED
+    Document.objects.filter(id=document_id).update(status=status)
+    dispatch_bulk_analyses_task.delay()
+
+
+def get_analysis_task_id(document_id: str) -> Optional[str]:
+    """ID de l'analyse en cours d'un document, None si aucune"""
+    return cache.get(ANALYSIS_LOCK_KEY.format(document_id))
+
+
+def build_analysis_pipeline(document_id: str, force: bool, pipeline_id: str,
+                            bulk: bool = False) -> chain:
+    """
+    Chaîne des étapes de l'analyse d'un document
+    
+    préparation (extraction) -> résumé -> mots-clés -> enregistrement. Les
+    étapes d'extraction et d'appel au modèle sont envoyées sur des files
+    distinctes (CELERY_TASK_ROUTES), servies par des workers dimensionnés
+    séparément.
     
     Args:
         document_id: ID du document à analyser
+        force: Refaire l'analyse même si elle est à jour
+        pipeline_id: ID de la dernière étape, qui porte le résultat de
+            l'analyse et le verrou du document
+        bulk: Envoyer les étapes LLM sur la file de masse
+    """
+    state = {
+        'document_id': str(document_id),
+        'force': force,
+        'pipeline_id': pipeline_id,
+    }
+    llm_options = {'queue': settings.CELERY_BULK_LLM_QUEUE} if bulk else {}
+    return chain(
+        prepare_analysis_task.s(state),
+        summarize_document_task.s().set(**llm_options),
+        extract_keywords_task.s().set(**llm_options),
+        save_analysis_task.s().set(task_id=pipeline_id),
+    )
+
+
+def get_running_analyses() -> Counter:
+    """
+    Analyses en cours par propriétaire
+    
+    Seuls les documents en cours d'analyse dont le verrou est actif sont
+    comptés : un document resté en cours après l'arrêt brutal d'un worker
+    n'occupe plus de place une fois son verrou expiré.
+    
+    Returns:
+        Counter ID du propriétaire -> nombre d'analyses en cours
+    """
+    from apps.documents.models import Document
+    
+    analyzing = list(
+        Document.objects.filter(status=Document.STATUS_ANALYZING).values_list('id', 'owner_id')
+    )
+    locks = cache.get_many([ANALYSIS_LOCK_KEY.format(document_id) for document_id, _ in analyzing])
+    return Counter(
+        owner_id for document_id, owner_id in analyzing
+        if ANALYSIS_LOCK_KEY.format(document_id) in locks
+    )
+
+
+def get_analysis_capacity() -> int:
+    """Nombre d'analyses simultanées : places des serveurs Ollama sains"""
+    return ai_service.router.capacity if ai_service.router else 0
+
+
+def get_analysis_load(interactive: bool = False) -> Dict:
+    """
+    Charge de la file d'analyse vue par une nouvelle analyse
+    
+    Une analyse interactive passe avant les analyses de masse : seules les
+    analyses en cours la précèdent. Une analyse de masse attend en plus
+    tous les documents en file d'attente.
+    
+    Args:
+        interactive: Analyse demandée par un utilisateur (/analyze/)
+        
+    Returns:
+        Voir AdmissionService.get_load
+    """
+    from apps.documents.models import Document
+    
+    if interactive:
+        queue_depth = sum(get_running_analyses().values())
+    else:
+        queue_depth = Document.objects.filter(
+            status__in=[Document.STATUS_QUEUED, Document.STATUS_ANALYZING]
+        ).count()
+    return AdmissionService.get_load(queue_depth, get_analysis_capacity())
+
+
+def get_analysis_fingerprint(extracted) -> str:
+    """
+    Empreinte des entrées de l'analyse d'un texte extrait (voir
+    AIService.get_fingerprint), calculée à partir de l'empreinte enregistrée
+    du texte
+    """
+    return ai_service.get_fingerprint_from_hash(extracted.get_text_hash(), keyword_strategy=settings.KEYWORD_STRATEGY)
+
+
+def is_analysis_stale(document) -> bool:
+    """
+    Le document n'a pas d'analyse, ou son analyse a été faite avec un autre
+    modèle, d'autres prompts ou d'autres options
+    """
+    if not hasattr(document, 'analysis'):
+        return True
+    return document.analysis.fingerprint != get_analysis_fingerprint(document.extracted_text)
+
+
+def is_backfill_window(now=None) -> bool:
+    """Heure comprise dans les plages du rattrapage (ANALYSIS_BACKFILL_HOURS et _DAYS)"""
+    now = timezone.localtime(now)
+    return (
+        now.hour in crontab_parser(24).parse(settings.ANALYSIS_BACKFILL_HOURS)
+        and now.isoweekday() % 7 in crontab_parser(7).parse(settings.ANALYSIS_BACKFILL_DAYS)
+    )
+
+
+def load_analysis_checkpoint(fingerprint: str) -> Dict:
+    """Résultats intermédiaires déjà obtenus pour une analyse (dict vide sinon)"""
+    return cache.get(ANALYSIS_CHECKPOINT_KEY.format(fingerprint)) or {}
+
+
+def save_analysis_checkpoint(fingerprint: str, **results):
+    """Enregistre des résultats intermédiaires d'une analyse"""
+    checkpoint = load_analysis_checkpoint(fingerprint)
+    checkpoint.update(results)
+    cache.set(ANALYSIS_CHECKPOINT_KEY.format(fingerprint), checkpoint, settings.ANALYSIS_CHECKPOINT_TTL)
+
+
+def use_local_keywords() -> bool:
+    """
+    Choix de la stratégie d'extraction des mots-clés
+    
+    KEYWORD_STRATEGY vaut 'llm' (modèle), 'local' (BM25 sur le corpus) ou
+    'auto' : mots-clés locaux quand la file des documents en attente
+    d'analyse sature les serveurs Ollama.
+    """
+    from apps.documents.models import Document
+    
+    if settings.KEYWORD_STRATEGY == 'local':
+        return True
+    if settings.KEYWORD_STRATEGY == 'llm':
+        return False
+    
+    backlog = Document.objects.filter(
+        status__in=[Document.STATUS_QUEUED, Document.STATUS_ANALYZING]
+    ).count()
+    return ai_service.is_saturated(backlog)
+
+
+@shared_task(bind=True, max_retries=3)
+def ingest_document_task(self, document_id: str, defer_analysis: bool = False):
+    """
+    Tâche asynchrone d'ingestion d'un document uploadé
+    
+    Calcule la taille, le nombre de pages et l'extrait du fichier, puis
+    met le document en file d'attente d'analyse IA, sauf si un document
+    identique a déjà été analysé.
+    
+    Args:
+        document_id: ID du document à ingérer
+        defer_analysis: Reporter l'analyse aux heures creuses (file
+            d'analyse saturée à l'upload)
     """
     from apps.documents.models import Document, DocumentAnalysis
     
     try:
-        logger.info(f"Début de l'analyse du document {document_id}")
+        logger.info(f"Début de l'ingestion du document {document_id}")
         
-        # Récupérer le document
         document = Document.objects.get(id=document_id)
+        document.set_status(Document.STATUS_EXTRACTING)
         
-        # Extraire le texte du fichier
-        file_path = document.file.path
-        text = FileService.extract_text(file_path)
-        
-        if not text or len(text.strip()) < 100:
-            logger.warning(f"Texte extrait trop court pour le document {document_id}")
-            return {
-                'success': False,
-                'error': 'Texte trop court pour analyse'
-            }
-        
-        # Analyser avec l'IA
-        analysis_result = ai_service.analyze_document(text)
-        
-        if analysis_result.get('error'):
-            logger.error(f"Erreur lors de l'analyse IA: {analysis_result}")
-            return {
-                'success': False,
-                'error': analysis_result.get('summary', 'Erreur inconnue')
-            }
-        
-        # Sauvegarder ou mettre à jour l'analyse
-        analysis, created = DocumentAnalysis.objects.update_or_create(
-            document=document,
-            defaults={
-                'summary': analysis_result['summary'],
-                'key_points': analysis_result['key_points'],
-                'model_used': analysis_result['model_used'],
-            }
-        )
+        # Extraction unique du texte (partagée par empreinte de contenu)
+        extracted = document.get_extracted_text()
         
-        # Marquer le document comme analysé
-        document.analyzed = True
+        # Mise à jour des fréquences documentaires du corpus (mots-clés locaux)
+        extracted.index_terms()
         
-        # Générer un snippet si vide
-        if not document.snippet:
-            document.snippet = FileService.generate_snippet(text)
+        document.file_size = document.file.size
+        document.page_count = extracted.page_count
+        document.snippet = FileService.generate_snippet(extracted.text)
+        document.save(update_fields=['file_size', 'page_count', 'snippet', 'updated_at'])
         
-        document.save()
+        # Réutiliser l'analyse d'un document au contenu identique
+        shared_analysis = DocumentAnalysis.find_shared(document, get_analysis_fingerprint(extracted))
+        if shared_analysis:
+            shared_analysis.share_with(document)
+            logger.info(f"Analyse partagée réutilisée pour le document {document_id}")
+        else:
+            queue_bulk_analysis(str(document_id), deferred=defer_analysis)
         
-        logger.info(f"Analyse du document {document_id} terminée avec succès")
+        logger.info(f"Ingestion du document {document_id} terminée")
         
         return {
             'success': True,
             'document_id': str(document_id),
-            'analysis_id': str(analysis.id),
         }
         
     except Document.DoesNotExist:
@@ -82,9 +440,489 @@ def analyze_document_task(self, document_id: str):
             'error': 'Document non trouvé'
         }
     except Exception as e:
-        logger.error(f"Erreur lors de l'analyse du document {document_id}: {e}")
-        # Retry si erreur
+        logger.error(f"Erreur lors de l'ingestion du document {document_id}: {e}")
+        if self.request.retries >= self.max_retries:
+            Document.objects.filter(id=document_id).update(status=Document.STATUS_FAILED)
         raise self.retry(exc=e, countdown=60)
 
 
+class AnalysisStageTask(Task):
+    """
+    Étape de la chaîne d'analyse d'un document
+    
+    Chaque étape reçoit l'état de l'analyse (dict) renvoyé par l'étape
+    précédente et le complète, puis publie son avancement (voir
+    get_analysis_status). Une étape qui échoue est relancée selon sa
+    politique de nouvelles tentatives ; si elle échoue définitivement, le
+    document et l'analyse passent en échec et le verrou d'analyse est
+    libéré.
+    """
+    
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        from apps.documents.models import Document
+        
+        state = args[0]
+        logger.error(f"Échec de l'étape {self.name} pour le document {state['document_id']}: {exc}")
+        Document.objects.filter(id=state['document_id']).update(status=Document.STATUS_FAILED)
+        # Les étapes suivantes ne seront pas exécutées : l'échec est reporté sur l'analyse
+        self.backend.store_result(state['pipeline_id'], exc, states.FAILURE)
+        release_analysis_lock(state['document_id'], state['pipeline_id'])
+        dispatch_bulk_analyses_task.delay()
+
 
+@shared_task(bind=True, base=AnalysisStageTask, **EXTRACTION_RETRY_POLICY)
+def prepare_analysis_task(self, state: Dict) -> Dict:
+    """
+    Étape 1 de l'analyse : extraction du texte et choix du travail à faire
+    
+    L'analyse s'arrête ici (state['result']) si une autre analyse du
+    document est en cours, si le texte est trop court, si l'analyse
+    existante a la même empreinte (même texte, modèle, prompts et options,
+    sauf avec force) ou si un document identique a déjà été analysé. Les
+    mots-clés sont calculés localement si demandé ou si Ollama est saturé.
+    
+    Args:
+        state: document_id, force, pipeline_id
+        
+    Returns:
+        État complété de fingerprint et key_points (None s'ils restent à
+        demander au modèle)
+    """
+    from apps.documents.models import Document, DocumentAnalysis
+    
+    document_id = state['document_id']
+    if not acquire_analysis_lock(document_id, state['pipeline_id']):
+        logger.info(f"Analyse du document {document_id} déjà en cours, analyse {state['pipeline_id']} ignorée")
+        return {
+            **state,
+            'result': {
+                'success': False,
+                'error': 'Analyse déjà en cours'
+            }
+        }
+    
+    logger.info(f"Début de l'analyse du document {document_id}")
+    
+    try:
+        document = Document.objects.get(id=document_id)
+    except Document.DoesNotExist:
+        logger.error(f"Document {document_id} non trouvé")
+        return {
+            **state,
+            'result': {
+                'success': False,
+                'error': 'Document non trouvé'
+            }
+        }
+    
+    document.set_status(Document.STATUS_ANALYZING)
+    
+    # Récupérer le texte extrait (une seule extraction par contenu de fichier)
+    extracted = document.get_extracted_text()
+    text = extracted.text.strip()
+    
+    if not text or len(text) < 100:
+        logger.warning(f"Texte extrait trop court pour le document {document_id}")
+        # Document consultable, mais sans analyse possible
+        document.set_status(Document.STATUS_READY)
+        return {
+            **state,
+            'result': {
+                'success': False,
+                'error': 'Texte trop court pour analyse'
+            }
+        }
+    
+    fingerprint = get_analysis_fingerprint(extracted)
+    
+    if state['force']:
+        # Analyse forcée : ne rien reprendre d'une analyse précédente
+        cache.delete(ANALYSIS_CHECKPOINT_KEY.format(fingerprint))
+    else:
+        # Analyse déjà à jour : rien à refaire
+        current = DocumentAnalysis.objects.filter(document=document, fingerprint=fingerprint).first()
+        if current:
+            document.set_status(Document.STATUS_READY)
+            logger.info(f"Analyse du document {document_id} déjà à jour")
+            return {
+                **state,
+                'result': {
+                    'success': True,
+                    'document_id': document_id,
+                    'analysis_id': str(current.id),
+                    'skipped': True,
+                }
+            }
+        
+        # Réutiliser l'analyse d'un document au contenu identique
+        shared_analysis = DocumentAnalysis.find_shared(document, fingerprint)
+        if shared_analysis:
+            analysis = shared_analysis.share_with(document)
+            logger.info(f"Analyse partagée réutilisée pour le document {document_id}")
+            return {
+                **state,
+                'result': {
+                    'success': True,
+                    'document_id': document_id,
+                    'analysis_id': str(analysis.id),
+                    'shared': True,
+                }
+            }
+    
+    # Mots-clés calculés localement si demandé ou si Ollama est saturé
+    keywords = load_analysis_checkpoint(fingerprint).get('key_points')
+    if keywords is None and use_local_keywords():
+        keywords = extracted.get_local_keywords()
+        save_analysis_checkpoint(fingerprint, key_points=keywords)
+    
+    report_analysis_progress(document_id, state['pipeline_id'], STAGE_EXTRACTED)
+    return {
+        **state,
+        'fingerprint': fingerprint,
+        'key_points': keywords,
+        'started_at': time.time(),
+    }
+
+
+@shared_task(bind=True, base=AnalysisStageTask, **LLM_RETRY_POLICY,
+             soft_time_limit=settings.ANALYSIS_TIME_LIMIT,
+             time_limit=settings.ANALYSIS_TIME_LIMIT + DEADLINE_MARGIN * 2)
+def summarize_document_task(self, state: Dict) -> Dict:
+    """
+    Étape 2 de l'analyse : résumé du document par le modèle
+    
+    Les appels au modèle disposent du temps restant avant la limite de la
+    tâche : à l'échéance, les requêtes en cours sont annulées et l'étape
+    est relancée. Les résumés de morceaux déjà obtenus restent dans le
+    cache des réponses, le résumé final dans le point de contrôle de
+    l'analyse : une nouvelle tentative ne les recalcule pas. Une analyse
+    forcée ne reprend pas les réponses en cache : le modèle est rappelé.
+    
+    Args:
+        state: État renvoyé par prepare_analysis_task
+        
+    Returns:
+        État complété de summary, model_used, et de key_points si l'analyse
+        combinée les a fournis
+    """
+    from apps.documents.models import Document
+    
+    if 'result' in state:
+        return state
+    
+    checkpoint = load_analysis_checkpoint(state['fingerprint'])
+    if 'summary' in checkpoint:
+        logger.info(f"Résumé du document {state['document_id']} repris du point de contrôle")
+        report_analysis_progress(state['document_id'], state['pipeline_id'], STAGE_SUMMARIZED)
+        return {**state, **checkpoint}
+    
+    document = Document.objects.get(id=state['document_id'])
+    text = document.get_extracted_text().text.strip()
+    
+    result = ai_service.summarize_document(
+        text,
+        deadline=get_task_deadline(self),
+        with_keywords=state['key_points'] is None,
+        refresh_cache=state['force']
+    )
+    if result['error']:
+        raise RuntimeError(result['summary'])
+    
+    results = {
+        'summary': result['summary'],
+        'model_used': result['model_used'],
+    }
+    if state['key_points'] is None and result['key_points']:
+        results['key_points'] = result['key_points']
+    if result['text'] != text:
+        # Texte réduit d'un long document : base de l'extraction des mots-clés
+        results['reduced_text'] = result['text']
+    
+    save_analysis_checkpoint(state['fingerprint'], **results)
+    report_analysis_progress(state['document_id'], state['pipeline_id'], STAGE_SUMMARIZED)
+    return {**state, **results}
+
+
+@shared_task(bind=True, base=AnalysisStageTask, **LLM_RETRY_POLICY,
+             soft_time_limit=settings.ANALYSIS_TIME_LIMIT,
+             time_limit=settings.ANALYSIS_TIME_LIMIT + DEADLINE_MARGIN * 2)
+def extract_keywords_task(self, state: Dict) -> Dict:
+    """
+    Étape 3 de l'analyse : mots-clés demandés au modèle
+    
+    Sans objet si les mots-clés ont été calculés localement ou obtenus avec
+    le résumé. Comme pour le résumé, une analyse forcée ne reprend pas la
+    réponse en cache.
+    
+    Args:
+        state: État renvoyé par summarize_document_task
+        
+    Returns:
+        État complété de key_points
+    """
+    from apps.documents.models import Document
+    
+    if 'result' in state:
+        return state
+    
+    if state.get('key_points') is not None:
+        report_analysis_progress(state['document_id'], state['pipeline_id'], STAGE_KEYWORDS)
+        return state
+    
+    text = state.get('reduced_text')
+    if not text:
+        document = Document.objects.get(id=state['document_id'])
+        text = document.get_extracted_text().text.strip()
+    
+    if not ai_service.is_available():
+        raise ConnectionError("Service d'IA non disponible")
+    
+    keywords = ai_service.extract_keywords(
+        text,
+        deadline=get_task_deadline(self),
+        refresh_cache=state['force']
+    )
+    
+    save_analysis_checkpoint(state['fingerprint'], key_points=keywords)
+    report_analysis_progress(state['document_id'], state['pipeline_id'], STAGE_KEYWORDS)
+    return {**state, 'key_points': keywords}
+
+
+@shared_task(bind=True, base=AnalysisStageTask, **EXTRACTION_RETRY_POLICY)
+def save_analysis_task(self, state: Dict) -> Dict:
+    """
+    Étape 4 de l'analyse : enregistrement du résultat
+    
+    Son ID est celui de l'analyse (renvoyé par enqueue_analysis). Le point
+    de contrôle de l'analyse est supprimé, le verrou du document libéré et
+    la place ainsi libérée proposée aux analyses de masse en attente.
+    
+    Args:
+        state: État renvoyé par extract_keywords_task
+        
+    Returns:
+        Résultat de l'analyse
+    """
+    from apps.documents.models import Document, DocumentAnalysis
+    
+    document_id = state['document_id']
+    
+    if 'result' in state:
+        release_analysis_lock(document_id, state['pipeline_id'])
+        dispatch_bulk_analyses_task.delay()
+        return state['result']
+    
+    document = Document.objects.get(id=document_id)
+    
+    # Sauvegarder ou mettre à jour l'analyse
+    analysis, created = DocumentAnalysis.objects.update_or_create(
+        document=document,
+        defaults={
+            'summary': state['summary'],
+            'key_points': state['key_points'],
+            'model_used': state['model_used'],
+            'fingerprint': state['fingerprint'],
+        }
+    )
+    
+    # Marquer le document comme analysé
+    document.analyzed = True
+    document.status = Document.STATUS_READY
+    
+    # Générer un snippet si vide
+    if not document.snippet:
+        document.snippet = FileService.generate_snippet(document.get_extracted_text().text)
+    
+    document.save()
+    
+    cache.delete(ANALYSIS_CHECKPOINT_KEY.format(state['fingerprint']))
+    release_analysis_lock(document_id, state['pipeline_id'])
+    AdmissionService.record_duration(time.time() - state['started_at'])
+    dispatch_bulk_analyses_task.delay()
+    
+    logger.info(f"Analyse du document {document_id} terminée avec succès")
+    
+    return {
+        'success': True,
+        'document_id': document_id,
+        'analysis_id': str(analysis.id),
+    }
+
+
+ANALYSIS_STAGES = (prepare_analysis_task, summarize_document_task, extract_keywords_task, save_analysis_task)
+
+
+@shared_task
+def dispatch_bulk_analyses_task() -> int:
+    """
+    Lance les analyses de masse en attente, dans la limite des places libres
+    
+    Le nombre d'analyses simultanées (interactives et de masse) est borné
+    par la capacité des serveurs Ollama sains : la file de masse reste
+    courte et une analyse interactive n'attend pas derrière des heures de
+    travail. Les places libres sont attribuées à tour de rôle au
+    propriétaire qui a le moins d'analyses en cours (à égalité, celui qui
+    attend depuis le plus longtemps) : un import massif d'un utilisateur
+    ne bloque pas les autres.
+    
+    Les documents dont l'analyse a été reportée ne sont lancés qu'en dehors
+    des heures ouvrées.
+    
+    Lancée à chaque mise en file, à la fin de chaque analyse et
+    périodiquement (celery beat).
+    
+    Returns:
+        Nombre d'analyses lancées
+    """
+    from django.db.models import Min
+    from apps.documents.models import Document
+    
+    if not cache.add(BULK_DISPATCH_LOCK_KEY, True, 60):
+        return 0
+    
+    try:
+        running = get_running_analyses()
+        free = get_analysis_capacity() - sum(running.values())
+        if free <= 0:
+            return 0
+        
+        statuses = [Document.STATUS_QUEUED]
+        if not ai_service.is_business_hours():
+            statuses.append(Document.STATUS_DEFERRED)
+        
+        # Propriétaires ayant des documents en attente -> plus ancienne attente
+        waiting = dict(
+            Document.objects.filter(status__in=statuses)
+            .values('owner_id')
+            .annotate(oldest=Min('created_at'))
+            .values_list('owner_id', 'oldest')
+        )
+        queues = {}
+        dispatched = 0
+        
+        while free > 0 and waiting:
+            owner_id = min(waiting, key=lambda owner: (running[owner], waiting[owner]))
+            if owner_id not in queues:
+                queues[owner_id] = iter(
+                    Document.objects.filter(owner_id=owner_id, status__in=statuses)
+                    .order_by('created_at')
+                    .values_list('id', flat=True)[:free]
+                )
+            document_id = next(queues[owner_id], None)
+            if document_id is None:
+                del waiting[owner_id]
+                continue
+            
+            Document.objects.filter(id=document_id, status__in=statuses).update(
+                status=Document.STATUS_ANALYZING
+            )
+            task_id, created = enqueue_analysis(str(document_id), bulk=True)
+            if created:
+                running[owner_id] += 1
+                free -= 1
+                dispatched += 1
+        
+        if dispatched:
+            logger.info(f"{dispatched} analyse(s) de masse lancée(s)")
+        return dispatched
+    finally:
+        cache.delete(BULK_DISPATCH_LOCK_KEY)
+
+
+@shared_task
+def backfill_analyses_task(batch_size: Optional[int] = None, ignore_window: bool = False) -> int:
+    """
+    Remet en analyse le lot suivant du rattrapage en cours (AnalysisBackfill)
+    
+    Les documents sans analyse ou dont l'analyse est périmée sont mis en
+    file d'attente d'analyse de masse, par lots de batch_size documents :
+    un nouveau lot n'est ajouté que lorsque la file d'attente est
+    redescendue sous cette taille, pour ne pas saturer les serveurs
+    Ollama. Rien n'est fait en dehors des plages du rattrapage, ni quand
+    le rattrapage est en pause.
+    
+    Lancée périodiquement pendant les plages du rattrapage (celery beat)
+    ou par la commande backfill_analyses.
+    
+    Args:
+        batch_size: Taille des lots (ANALYSIS_BACKFILL_BATCH_SIZE par défaut)
+        ignore_window: Lancer le lot même en dehors des plages du rattrapage
+        
+    Returns:
+        Nombre de documents remis en analyse
+    """
+    from apps.documents.models import AnalysisBackfill, Document
+    
+    backfill = AnalysisBackfill.get_current()
+    if backfill is None or backfill.status != AnalysisBackfill.STATUS_RUNNING:
+        return 0
+    if not ignore_window and not is_backfill_window():
+        return 0
+    if not cache.add(BACKFILL_LOCK_KEY, True, get_analysis_lock_timeout()):
+        return 0
+    
+    try:
+        room = (batch_size or settings.ANALYSIS_BACKFILL_BATCH_SIZE) - Document.objects.filter(
+            status=Document.STATUS_QUEUED
+        ).count()
+        queued = 0
+        
+        while room > 0:
+            documents = list(backfill.get_remaining_documents()[:BACKFILL_SCAN_SIZE])
+            if not documents:
+                backfill.set_status(AnalysisBackfill.STATUS_COMPLETED)
+                logger.info(f"Rattrapage des analyses terminé: {backfill.queued_documents} document(s) remis en analyse")
+                break
+            
+            for document in documents:
+                backfill.cursor = document.id
+                backfill.scanned_documents += 1
+                if not is_analysis_stale(document):
+                    continue
+                # Un document remis en analyse entre-temps est laissé tel quel
+                if Document.objects.filter(id=document.id, status=document.status).update(
+                    status=Document.STATUS_QUEUED
+                ):
+                    backfill.queued_documents += 1
+                    queued += 1
+                    room -= 1
+                    if room <= 0:
+                        break
+            
+            # Progression enregistrée après chaque lot, sans toucher au
+            # statut (pause demandée pendant le parcours)
+            backfill.save(update_fields=['cursor', 'scanned_documents', 'queued_documents', 'updated_at'])
+        
+        if queued:
+            logger.info(f"Rattrapage des analyses: {queued} document(s) remis en analyse")
+            dispatch_bulk_analyses_task.delay()
+        return queued
+    finally:
+        cache.delete(BACKFILL_LOCK_KEY)
+
+
+@shared_task
+def cleanup_upload_sessions_task() -> int:
+    """
+    Supprime les uploads par morceaux abandonnés et leurs fichiers partiels
+    
+    Lancée toutes les heures (celery beat).
+    
+    Returns:
+        Nombre d'uploads supprimés
+    """
+    return UploadService.cleanup_expired()
+
+
+@shared_task
+def warm_up_model_task():
+    """
+    Charge le modèle IA en mémoire sur les serveurs Ollama
+    
+    Lancée au démarrage des workers et périodiquement pendant les heures
+    ouvrées (celery beat), pour que les analyses ne subissent pas le temps
+    de chargement du modèle.
+    """
+    results = ai_service.warm_up()
+    logger.info(f"Préchargement du modèle {ai_service.model}: {results}")
+    return results
@@ -0,0 +1,77 @@
+"""
+Tests de la chaîne d'analyse des documents
+"""
+import uuid
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from apps.documents import tasks
+from apps.documents.models import Document, ExtractedText
+from services.ai_service import ai_service
+from services.llm_cache import LLMResponseCache
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ForcedAnalysisTests(TestCase):
+    """Une analyse forcée rappelle le modèle au lieu de reprendre le cache des réponses"""
+    
+    def setUp(self):
+        owner = get_user_model().objects.create_user(
+            email='force@example.com',
+            password='test',
+            username='force',
+            first_name='Test',
+            last_name='Force'
+        )
+        extracted = ExtractedText.objects.create(
+            content_hash='f' * 64,
+            text='Texte du document assez long pour être résumé par le modèle. ' * 10
+        )
+        self.document = Document.objects.create(
+            title='Document',
+            owner=owner,
+            file='documents/document.txt',
+            content_hash='f' * 64,
+            extracted_text=extracted
+        )
+        
+        # Chaque appel au modèle renvoie un nouveau résumé
+        self.runner = mock.Mock()
+        self.runner.generate_many.side_effect = lambda requests, deadline: [
+            {'response': f'Résumé {self.runner.generate_many.call_count}'} for _ in requests
+        ]
+        for patcher in [
+            mock.patch.object(ai_service, 'async_runner', self.runner, create=True),
+            mock.patch.object(ai_service, 'router', mock.Mock(is_open=False), create=True),
+            mock.patch.object(ai_service, 'response_cache', LLMResponseCache(ttl=60, max_entries=10)),
+            mock.patch.object(ai_service, 'combined_analysis', False),
+            mock.patch.object(ai_service, 'is_available', return_value=True),
+            mock.patch.object(ai_service, 'use_gateway', return_value=False),
+            mock.patch.object(tasks, 'report_analysis_progress'),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def summarize(self, force):
+        """Exécute l'étape de résumé (nouvelle analyse, sans point de contrôle)"""
+        return tasks.summarize_document_task({
+            'document_id': str(self.document.id),
+            'force': force,
+            'pipeline_id': str(uuid.uuid4()),
+            'fingerprint': uuid.uuid4().hex,
+            'key_points': ['local'],
+        })
+    
+    def test_forced_analysis_calls_model_again(self):
+        self.assertEqual(self.summarize(force=False)['summary'], 'Résumé 1')
+        self.assertEqual(self.summarize(force=False)['summary'], 'Résumé 1')
+        self.assertEqual(self.runner.generate_many.call_count, 1)
+        
+        self.assertEqual(self.summarize(force=True)['summary'], 'Résumé 2')
+        self.assertEqual(self.runner.generate_many.call_count, 2)
+        
+        # La nouvelle réponse remplace l'ancienne dans le cache
+        self.assertEqual(self.summarize(force=False)['summary'], 'Résumé 2')
+        self.assertEqual(self.runner.generate_many.call_count, 2)
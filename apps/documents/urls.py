@@ -8,12 +8,25 @@ urlpatterns = [
     path('', views.DocumentListCreateView.as_view(), name='document_list'),
     path('<uuid:pk>/', views.DocumentDetailView.as_view(), name='document_detail'),
     path('<uuid:pk>/analyze/', views.analyze_document, name='document_analyze'),
+    path('<uuid:pk>/summary/stream/', views.stream_summary, name='document_summary_stream'),
+    
+    # Upload par morceaux
+    path('uploads/', views.upload_session_create, name='upload_session_create'),
+    path('uploads/<uuid:pk>/', views.upload_session_detail, name='upload_session_detail'),
+    path('uploads/<uuid:pk>/chunks/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:pk>/complete/', views.upload_complete, name='upload_complete'),
     
     # Tags
     path('tags/', views.document_tags, name='document_tags'),
     
     # Stats
     path('stats/', views.document_stats, name='document_stats'),
+    path('ai/status/', views.ai_status, name='ai_status'),
+    
+    # File d'analyse et suivi des analyses
+    path('queue/', views.analysis_queue, name='analysis_queue'),
+    path('tasks/<uuid:task_id>/', views.analysis_task_status, name='analysis_task_status'),
+    path('tasks/<uuid:task_id>/events/', views.analysis_task_events, name='analysis_task_events'),
 ]
 
 
@@ -3,16 +3,69 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
+import json
+import time
+import uuid
+
+from celery import states
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Q
 
-from .models import Document, DocumentTag
+from .models import Document, DocumentAnalysis, DocumentTag, UploadSession
 from .serializers import (
     DocumentSerializer, DocumentListSerializer, DocumentCreateSerializer,
-    DocumentUpdateSerializer, DocumentTagSerializer
+    DocumentUpdateSerializer, DocumentTagSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer
+)
+from .tasks import (
+    acquire_analysis_lock, enqueue_analysis, get_analysis_fingerprint, get_analysis_load,
+    get_analysis_status, get_analysis_task_id, ingest_document_task, queue_bulk_analysis,
+    release_analysis_lock
 )
-from .tasks import analyze_document_task
+from services.admission_service import AdmissionService
+from services.ai_service import ai_service
 from services.file_service import FileService
+from services.upload_service import UploadService
+
+
+class AnalysisRejected(Exception):
+    """File d'analyse saturée : la requête est refusée (contrôle d'admission)"""
+    
+    def __init__(self, load):
+        super().__init__("File d'analyse saturée")
+        self.load = load
+
+
+def _admission_rejected_response(load):
+    """Réponse 429 d'une requête refusée par le contrôle d'admission"""
+    retry_after = AdmissionService.get_retry_after(load)
+    return Response({
+        'error': "File d'analyse saturée, réessayez plus tard",
+        'queue_depth': load['queue_depth'],
+        'estimated_wait': load['estimated_wait'],
+        'retry_after': retry_after,
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(retry_after)})
+
+
+def _check_upload_admission():
+    """
+    Contrôle d'admission d'un nouveau document
+    
+    Returns:
+        True si l'analyse du document doit être reportée aux heures creuses
+    
+    Raises:
+        AnalysisRejected si la file d'analyse est saturée et la politique
+        d'upload est 'reject'
+    """
+    load = get_analysis_load()
+    decision = AdmissionService.decide(load, settings.ADMISSION_UPLOAD_POLICY)
+    if decision == AdmissionService.REJECT:
+        raise AnalysisRejected(load)
+    return decision == AdmissionService.DEFER
 
 
 class DocumentListCreateView(generics.ListCreateAPIView):
@@ -68,6 +121,10 @@ class DocumentListCreateView(generics.ListCreateAPIView):
             tag_names = tags.split(',')
             queryset = queryset.filter(tags__name__in=tag_names)
         
+        ingestion_status = self.request.query_params.get('status')
+        if ingestion_status:
+            queryset = queryset.filter(status=ingestion_status)
+        
         if analyzed is not None:
             is_analyzed = analyzed.lower() == 'true'
             queryset = queryset.filter(analyzed=is_analyzed)
@@ -83,6 +140,18 @@ class DocumentListCreateView(generics.ListCreateAPIView):
         
         return queryset.select_related('owner').prefetch_related('tags')
     
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            document = self.perform_create(serializer)
+        except AnalysisRejected as e:
+            return _admission_rejected_response(e.load)
+        
+        # Le fichier est reçu : le reste de l'ingestion se fait en arrière-plan
+        data = DocumentSerializer(document, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+    
     def perform_create(self, serializer):
         # Valider le fichier
         file = self.request.FILES.get('file')
@@ -93,11 +162,14 @@ class DocumentListCreateView(generics.ListCreateAPIView):
         if not is_valid:
             raise ValueError(error)
         
+        # Contrôle d'admission : file d'analyse saturée
+        defer_analysis = _check_upload_admission()
+        
         # Créer le document
         document = serializer.save(owner=self.request.user)
         
-        # Lancer l'analyse asynchrone
-        analyze_document_task.delay(str(document.id))
+        # Lancer l'ingestion asynchrone (extraction puis analyse)
+        ingest_document_task.delay(str(document.id), defer_analysis=defer_analysis)
         
         return document
 
@@ -144,9 +216,9 @@ class DocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
         if instance.owner != user and not user.is_admin:
             raise PermissionError("Vous n'avez pas la permission de supprimer ce document")
         
-        # Supprimer le fichier physique
-        if instance.file:
-            instance.file.delete()
+        # Supprimer le fichier physique s'il n'est plus référencé par aucun document
+        if instance.file and not instance.is_file_shared():
+            instance.file.delete(save=False)
         
         instance.delete()
 
@@ -154,7 +226,13 @@ class DocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def analyze_document(request, pk):
-    """Lance l'analyse IA d'un document"""
+    """
+    Lance l'analyse IA d'un document
+    
+    L'analyse n'est pas relancée si elle est à jour, sauf avec force=true.
+    Si la file d'analyse est saturée, l'analyse est refusée (429 avec
+    Retry-After) ou reportée aux heures creuses selon ADMISSION_ANALYZE_POLICY.
+    """
     document = get_object_or_404(Document, pk=pk)
     
     # Vérifier les permissions
@@ -164,13 +242,444 @@ def analyze_document(request, pk):
             'error': 'Vous n\'avez pas la permission d\'analyser ce document'
         }, status=status.HTTP_403_FORBIDDEN)
     
-    # Lancer l'analyse
-    task = analyze_document_task.delay(str(document.id))
+    force = str(request.data.get('force', '')).lower() in ('1', 'true')
+    
+    # Analyse déjà à jour (même texte, modèle, prompts et options) : pas de tâche
+    if not force and document.extracted_text_id and hasattr(document, 'analysis'):
+        fingerprint = get_analysis_fingerprint(document.extracted_text)
+        if document.analysis.fingerprint == fingerprint:
+            return Response({
+                'message': 'Analyse déjà à jour',
+                'task_id': None,
+                'document_id': str(document.id),
+                'analysis_id': str(document.analysis.id)
+            })
+    
+    # Analyse de ce document déjà en cours
+    task_id = get_analysis_task_id(str(document.id))
+    if task_id:
+        return Response({
+            'message': 'Analyse déjà en cours',
+            'task_id': task_id,
+            'document_id': str(document.id)
+        })
+    
+    # Contrôle d'admission : file d'analyse saturée
+    load = get_analysis_load(interactive=True)
+    decision = AdmissionService.decide(load, settings.ADMISSION_ANALYZE_POLICY)
+    if decision == AdmissionService.REJECT:
+        return _admission_rejected_response(load)
+    if decision == AdmissionService.DEFER:
+        queue_bulk_analysis(str(document.id), deferred=True)
+        return Response({
+            'message': 'Analyse reportée aux heures creuses',
+            'task_id': None,
+            'document_id': str(document.id),
+            'queue_depth': load['queue_depth'],
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    # Lancer l'analyse (sauf si une analyse vient d'être lancée entre-temps)
+    task_id, created = enqueue_analysis(str(document.id), force=force)
     
     return Response({
-        'message': 'Analyse lancée',
-        'task_id': task.id,
-        'document_id': str(document.id)
+        'message': 'Analyse lancée' if created else 'Analyse déjà en cours',
+        'task_id': task_id,
+        'document_id': str(document.id),
+        'queue_depth': load['queue_depth'],
+        'estimated_wait': load['estimated_wait'],
+    })
+
+
+def _sse_event(event, data):
+    """Formate un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _ClosingStream:
+    """Itérateur d'un flux exécutant on_close à sa fermeture, même s'il n'a jamais été lu"""
+    
+    def __init__(self, iterator, on_close):
+        self.iterator = iterator
+        self.on_close = on_close
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        return next(self.iterator)
+    
+    def close(self):
+        try:
+            self.iterator.close()
+        finally:
+            self.on_close()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def stream_summary(request, pk):
+    """
+    Génère le résumé d'un document en diffusant les tokens (Server-Sent Events)
+    
+    Événements : token (fragment du résumé), done (résumé complet enregistré),
+    error. Le verrou d'analyse du document est pris pendant la génération :
+    impossible tant qu'une analyse est en cours (409), ou tant que le texte
+    n'a pas été extrait par l'ingestion (409). Le résumé est enregistré avec
+    des mots-clés calculés localement et une empreinte propre au résumé
+    diffusé : une analyse complète (/analyze/) le remplace.
+    """
+    document = get_object_or_404(Document, pk=pk)
+    
+    # Vérifier les permissions
+    user = request.user
+    if document.owner != user and not user.is_admin:
+        return Response({
+            'error': 'Vous n\'avez pas la permission d\'analyser ce document'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    # Texte pas encore extrait : l'extraction n'a pas lieu dans la requête HTTP
+    if not document.extracted_text_id:
+        return Response({
+            'error': 'Texte du document en cours d\'extraction, réessayez plus tard',
+            'status': document.status
+        }, status=status.HTTP_409_CONFLICT)
+    
+    extracted = document.extracted_text
+    text = extracted.text.strip()
+    if len(text) < 100:
+        return Response({
+            'error': 'Texte trop court pour générer un résumé'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Contrôle d'admission : un flux ne peut pas être reporté
+    load = get_analysis_load(interactive=True)
+    if AdmissionService.decide(load, settings.ADMISSION_ANALYZE_POLICY) != AdmissionService.ADMIT:
+        return _admission_rejected_response(load)
+    
+    stream_id = str(uuid.uuid4())
+    if not acquire_analysis_lock(str(document.id), stream_id):
+        return Response({
+            'error': 'Analyse déjà en cours',
+            'task_id': get_analysis_task_id(str(document.id)),
+            'document_id': str(document.id)
+        }, status=status.HTTP_409_CONFLICT)
+    
+    def events():
+        parts = []
+        try:
+            for token in ai_service.stream_summary(text):
+                parts.append(token)
+                yield _sse_event('token', {'token': token})
+        except Exception as e:
+            yield _sse_event('error', {'error': str(e)})
+            return
+        
+        summary = ''.join(parts).strip()
+        if not summary:
+            yield _sse_event('error', {'error': 'Le modèle a renvoyé un résumé vide'})
+            return
+        
+        analysis, _ = DocumentAnalysis.objects.update_or_create(
+            document=document,
+            defaults={
+                'summary': summary,
+                'key_points': extracted.get_local_keywords(),
+                'model_used': ai_service.model,
+                'fingerprint': ai_service.get_fingerprint(text, keyword_strategy='local', streamed=True),
+            }
+        )
+        document.analyzed = True
+        document.status = Document.STATUS_READY
+        document.save(update_fields=['analyzed', 'status', 'updated_at'])
+        
+        yield _sse_event('done', {'summary': summary, 'analysis_id': str(analysis.id)})
+    
+    # Verrou libéré à la fin de la réponse, y compris si le client se
+    # déconnecte avant le premier événement
+    stream = _ClosingStream(events(), lambda: release_analysis_lock(str(document.id), stream_id))
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Intervalle des commentaires SSE maintenant un flux ouvert sans événement (secondes)
+SSE_KEEP_ALIVE_INTERVAL = 15
+
+
+def _get_analysis_status(request, task_id):
+    """
+    Avancement d'une analyse, si l'utilisateur a accès à son document
+    
+    Returns:
+        Tuple (avancement, None) ou (None, réponse d'erreur)
+    """
+    task_status = get_analysis_status(str(task_id))
+    document = None
+    if task_status is not None:
+        document = Document.objects.filter(pk=task_status['document_id']).first()
+    if document is None:
+        return None, Response({
+            'error': 'Analyse introuvable'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    user = request.user
+    if document.owner != user and not user.is_admin:
+        return None, Response({
+            'error': 'Vous n\'avez pas la permission de consulter cette analyse'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    return task_status, None
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analysis_task_status(request, task_id):
+    """
+    Avancement d'une analyse (task_id renvoyé par /analyze/)
+    
+    Étapes : queued, extracted, summarized, keywords, saved. Le résultat
+    est lu dans le backend de résultats Celery, sans requête sur le document.
+    """
+    task_status, error = _get_analysis_status(request, task_id)
+    if error:
+        return error
+    return Response(task_status)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analysis_task_events(request, task_id):
+    """
+    Suit une analyse en direct (Server-Sent Events)
+    
+    Événements : progress (étape franchie), done (analyse terminée, avec
+    son résultat), error (analyse en échec) et timeout (analyse toujours en
+    cours au bout de ANALYSIS_EVENTS_TIMEOUT secondes). Le client est
+    prévenu de la fin de l'analyse sans avoir à interroger l'API.
+    
+    Le flux occupe un worker (ou thread) du serveur web jusqu'à sa fin :
+    après un timeout, le client rouvre le flux s'il attend toujours.
+    """
+    task_status, error = _get_analysis_status(request, task_id)
+    if error:
+        return error
+    
+    def events():
+        current = task_status
+        last_stage = None
+        last_event_at = time.monotonic()
+        deadline = last_event_at + settings.ANALYSIS_EVENTS_TIMEOUT
+        
+        while True:
+            if current['state'] == states.SUCCESS:
+                yield _sse_event('done', current)
+                return
+            if current['state'] == states.FAILURE:
+                yield _sse_event('error', current)
+                return
+            
+            now = time.monotonic()
+            if current['stage'] != last_stage:
+                last_stage = current['stage']
+                last_event_at = now
+                yield _sse_event('progress', current)
+            elif now - last_event_at >= SSE_KEEP_ALIVE_INTERVAL:
+                # Commentaire SSE : maintient la connexion ouverte
+                last_event_at = now
+                yield ': keep-alive\n\n'
+            
+            if now >= deadline:
+                yield _sse_event('timeout', current)
+                return
+            
+            time.sleep(settings.ANALYSIS_EVENTS_POLL_INTERVAL)
+            current = get_analysis_status(str(task_id))
+            if current is None:
+                yield _sse_event('error', {'error': 'Analyse introuvable'})
+                return
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_session_create(request):
+    """Initialise un upload par morceaux"""
+    serializer = UploadSessionCreateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    session = serializer.save(owner=request.user)
+    
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_session_detail(request, pk):
+    """État d'un upload par morceaux (pour la reprise) ou abandon de l'upload"""
+    session = get_object_or_404(UploadSession, pk=pk, owner=request.user)
+    
+    if request.method == 'DELETE':
+        if session.status == UploadSession.STATUS_FINALIZING:
+            return Response({
+                'error': 'Upload en cours de finalisation'
+            }, status=status.HTTP_409_CONFLICT)
+        UploadService.discard(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    return Response(UploadSessionSerializer(session).data)
+
+
+def _unexpected_chunk_response(session):
+    """Réponse 409 indiquant au client le prochain morceau attendu"""
+    return Response({
+        'error': 'Morceau inattendu',
+        'next_chunk': session.next_chunk,
+        'received_size': session.received_size,
+    }, status=status.HTTP_409_CONFLICT)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, pk, index):
+    """
+    Reçoit le morceau numéro index d'un upload
+    
+    Le corps de la requête contient les octets bruts du morceau, qui
+    commence à l'offset index * chunk_size.
+    
+    Le morceau est écrit sans verrou ; la session n'est verrouillée que pour
+    revérifier l'offset et enregistrer la taille reçue.
+    """
+    session = get_object_or_404(
+        UploadSession,
+        pk=pk,
+        owner=request.user,
+        status=UploadSession.STATUS_ACTIVE
+    )
+    
+    offset = index * session.chunk_size
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    
+    # Morceau déjà reçu (renvoi après une coupure)
+    if length and offset + length <= session.received_size:
+        return Response(UploadSessionSerializer(session).data)
+    
+    if offset != session.received_size:
+        return _unexpected_chunk_response(session)
+    
+    is_last = offset + length == session.total_size
+    if (not length or length > session.chunk_size or offset + length > session.total_size
+            or (length != session.chunk_size and not is_last)):
+        return Response({
+            'error': f'Taille de morceau invalide (attendu: {session.chunk_size} octets)'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    is_valid, error, sha256 = UploadService.write_chunk(session, offset, request.stream, length)
+    if not is_valid:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update(),
+            pk=pk,
+            owner=request.user,
+            status=UploadSession.STATUS_ACTIVE
+        )
+        if not UploadService.commit_chunk(session, offset, length, sha256):
+            return _unexpected_chunk_response(session)
+    
+    return Response(UploadSessionSerializer(session).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_complete(request, pk):
+    """
+    Finalise un upload par morceaux et crée le document
+    
+    Si la file d'analyse est saturée et que la politique d'upload est
+    'reject', la finalisation est refusée (429) : la session reste ouverte
+    et peut être finalisée plus tard.
+    
+    La session est réservée (statut finalizing) sous verrou, puis le
+    document est créé hors transaction : le déplacement du fichier ne
+    bloque pas la ligne de la session.
+    """
+    try:
+        defer_analysis = _check_upload_admission()
+    except AnalysisRejected as e:
+        return _admission_rejected_response(e.load)
+    
+    with transaction.atomic():
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update(),
+            pk=pk,
+            owner=request.user,
+            status=UploadSession.STATUS_ACTIVE
+        )
+        
+        if not session.is_complete:
+            return Response({
+                'error': 'Upload incomplet',
+                'next_chunk': session.next_chunk,
+                'received_size': session.received_size,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        session.status = UploadSession.STATUS_FINALIZING
+        session.save(update_fields=['status', 'updated_at'])
+    
+    uploaded_file = UploadService.open_uploaded_file(session)
+    try:
+        serializer = DocumentCreateSerializer(data={**session.metadata, 'file': uploaded_file})
+        serializer.is_valid(raise_exception=True)
+        document = serializer.save(owner=request.user)
+    except Exception:
+        # Session rouverte : la finalisation peut être relancée
+        session.status = UploadSession.STATUS_ACTIVE
+        session.save(update_fields=['status', 'updated_at'])
+        raise
+    finally:
+        uploaded_file.close()
+    
+    session.status = UploadSession.STATUS_COMPLETED
+    session.document = document
+    session.save(update_fields=['status', 'document', 'updated_at'])
+    UploadService.discard(session)
+    
+    # Lancer l'ingestion asynchrone (extraction puis analyse)
+    ingest_document_task.delay(str(document.id), defer_analysis=defer_analysis)
+    
+    return Response(
+        DocumentSerializer(document, context={'request': request}).data,
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analysis_queue(request):
+    """
+    État de la file d'analyse : profondeur et attente estimée
+    
+    interactive : analyse demandée avec /analyze/ ; bulk : analyse d'un
+    document uploadé. queued et deferred : documents de l'utilisateur en
+    attente d'analyse et reportés aux heures creuses.
+    """
+    interactive = get_analysis_load(interactive=True)
+    bulk = get_analysis_load()
+    own_documents = Document.objects.filter(owner=request.user)
+    
+    return Response({
+        'interactive': interactive,
+        'bulk': bulk,
+        'business_hours': ai_service.is_business_hours(),
+        'queued': own_documents.filter(status=Document.STATUS_QUEUED).count(),
+        'deferred': own_documents.filter(status=Document.STATUS_DEFERRED).count(),
     })
 
 
@@ -202,4 +711,13 @@ def document_stats(request):
     })
 
 
-
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ai_status(request):
+    """État du service IA et statistiques du cache (admin uniquement)"""
+    if not request.user.is_admin:
+        return Response({
+            'error': 'Permission refusée'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    return Response(ai_service.get_status())
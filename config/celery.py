@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_ready
 
 # Définir les settings Django par défaut pour Celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -13,6 +14,22 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_ready.connect
+def warm_up_model(sender, **kwargs):
+    """
+    Charge le modèle IA en mémoire dès qu'un worker LLM est prêt
+    
+    Les autres workers (extraction) ne déclenchent pas de préchauffage :
+    le modèle ne sert qu'aux tâches de la file LLM.
+    """
+    from django.conf import settings
+    from apps.documents.tasks import warm_up_model_task
+    
+    queues = {queue.name for queue in sender.task_consumer.queues}
+    if settings.OLLAMA_KEEP_WARM and settings.CELERY_LLM_QUEUE in queues:
+        warm_up_model_task.delay()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -145,6 +146,21 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Upload : l'empreinte SHA-256 est calculée pendant la réception du fichier
+FILE_UPLOAD_HANDLERS = [
+    'utils.upload_handlers.HashingMemoryFileUploadHandler',
+    'utils.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+# Upload par morceaux (reprise possible après une coupure). Les morceaux
+# sont ajoutés à un fichier partiel local, sur le même système de fichiers
+# que MEDIA_ROOT : à la finalisation, il est déplacé (et non copié) par le
+# stockage. Un upload sans nouveau morceau depuis UPLOAD_SESSION_TTL_HOURS
+# heures est abandonné : session et fichier partiel sont supprimés (celery beat).
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.getenv('CHUNKED_UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+CHUNKED_UPLOAD_DIR = MEDIA_ROOT / 'uploads'
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -188,6 +204,71 @@ CORS_ALLOW_CREDENTIALS = True
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://ollama:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'mistral:7b')
 OLLAMA_TIMEOUT = int(os.getenv('OLLAMA_TIMEOUT', '60'))
+# Plusieurs serveurs Ollama (séparés par des virgules) : les requêtes sont
+# réparties entre eux ; à défaut, seul OLLAMA_HOST est utilisé
+OLLAMA_HOSTS = [
+    host.strip() for host in os.getenv('OLLAMA_HOSTS', '').split(',') if host.strip()
+] or [OLLAMA_HOST]
+# Requêtes simultanées acceptées par chaque serveur (OLLAMA_NUM_PARALLEL côté Ollama)
+OLLAMA_HOST_SLOTS = int(os.getenv('OLLAMA_HOST_SLOTS', '1'))
+# Durée pendant laquelle un modèle reste chargé après utilisation (secondes)
+OLLAMA_KEEP_ALIVE = int(os.getenv('OLLAMA_KEEP_ALIVE', '300'))
+# Heures ouvrées : le modèle est chargé au démarrage des workers puis
+# maintenu en mémoire jusqu'à la fin de la journée
+OLLAMA_KEEP_WARM = os.getenv('OLLAMA_KEEP_WARM', 'True') == 'True'
+OLLAMA_BUSINESS_START_HOUR = int(os.getenv('OLLAMA_BUSINESS_START_HOUR', '8'))
+OLLAMA_BUSINESS_END_HOUR = int(os.getenv('OLLAMA_BUSINESS_END_HOUR', '19'))
+OLLAMA_BUSINESS_DAYS = os.getenv('OLLAMA_BUSINESS_DAYS', 'mon-fri')
+# Intervalle de vérification du chargement du modèle pendant les heures ouvrées (minutes)
+OLLAMA_WARM_UP_INTERVAL = int(os.getenv('OLLAMA_WARM_UP_INTERVAL', '10'))
+# Résumé et mots-clés demandés en un seul appel (réponse JSON)
+OLLAMA_COMBINED_ANALYSIS = os.getenv('OLLAMA_COMBINED_ANALYSIS', 'True') == 'True'
+# Durée de validité d'une vérification de santé réussie (secondes)
+OLLAMA_HEALTH_TTL = int(os.getenv('OLLAMA_HEALTH_TTL', '30'))
+# Disjoncteur : ouvert après N échecs consécutifs, nouvel essai après X secondes
+OLLAMA_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('OLLAMA_CIRCUIT_FAILURE_THRESHOLD', '3'))
+OLLAMA_CIRCUIT_RECOVERY_TIMEOUT = int(os.getenv('OLLAMA_CIRCUIT_RECOVERY_TIMEOUT', '30'))
+# Résumé hiérarchique (map-reduce) des documents plus longs que la fenêtre envoyée au modèle
+OLLAMA_MAP_REDUCE = os.getenv('OLLAMA_MAP_REDUCE', 'False') == 'True'
+OLLAMA_CHUNK_TOKENS = int(os.getenv('OLLAMA_CHUNK_TOKENS', '1000'))
+# Nombre maximum de requêtes simultanées envoyées à Ollama par un processus
+OLLAMA_CONCURRENCY = int(os.getenv('OLLAMA_CONCURRENCY', '2'))
+# Passerelle IA (commande run_ai_gateway) : les workers lui confient leurs
+# requêtes, qu'elle envoie par lots (au plus OLLAMA_GATEWAY_MAX_BATCH,
+# attendus au plus OLLAMA_GATEWAY_MAX_WAIT secondes) pour occuper toutes les
+# places des serveurs Ollama ; OLLAMA_GATEWAY_TIMEOUT borne l'attente d'une
+# réponse sans échéance (secondes)
+OLLAMA_GATEWAY_ENABLED = os.getenv('OLLAMA_GATEWAY_ENABLED', 'False') == 'True'
+OLLAMA_GATEWAY_REDIS_URL = os.getenv('OLLAMA_GATEWAY_REDIS_URL', os.getenv('REDIS_URL', 'redis://redis:6379/0'))
+OLLAMA_GATEWAY_MAX_BATCH = int(os.getenv('OLLAMA_GATEWAY_MAX_BATCH', '8'))
+OLLAMA_GATEWAY_MAX_WAIT = float(os.getenv('OLLAMA_GATEWAY_MAX_WAIT', '0.05'))
+OLLAMA_GATEWAY_TIMEOUT = int(os.getenv('OLLAMA_GATEWAY_TIMEOUT', '300'))
+# Pré-résumé extractif (NumPy) : seules les phrases les plus informatives du
+# document sont envoyées au modèle, dans un budget proportionnel à sa taille
+OLLAMA_EXTRACTIVE_ENABLED = os.getenv('OLLAMA_EXTRACTIVE_ENABLED', 'True') == 'True'
+OLLAMA_EXTRACTIVE_RATIO = float(os.getenv('OLLAMA_EXTRACTIVE_RATIO', '0.1'))
+OLLAMA_EXTRACTIVE_MIN_TOKENS = int(os.getenv('OLLAMA_EXTRACTIVE_MIN_TOKENS', '500'))
+OLLAMA_EXTRACTIVE_MAX_TOKENS = int(os.getenv('OLLAMA_EXTRACTIVE_MAX_TOKENS', '1000'))
+# Mots-clés : 'llm' (modèle), 'local' (BM25 sur le corpus, en quelques
+# millisecondes) ou 'auto' (local quand Ollama est saturé)
+KEYWORD_STRATEGY = os.getenv('KEYWORD_STRATEGY', 'auto')
+# Ollama est saturé au-delà de ce nombre de documents en attente par place de traitement
+OLLAMA_SATURATION_BACKLOG = int(os.getenv('OLLAMA_SATURATION_BACKLOG', '4'))
+# Cache des réponses du modèle (mémoire locale LRU + Redis)
+OLLAMA_CACHE_ENABLED = os.getenv('OLLAMA_CACHE_ENABLED', 'True') == 'True'
+OLLAMA_CACHE_TTL = int(os.getenv('OLLAMA_CACHE_TTL', str(30 * 24 * 3600)))
+OLLAMA_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('OLLAMA_CACHE_LOCAL_MAX_ENTRIES', '256'))
+
+# Extraction de texte
+# Les PDF d'au moins PDF_PARALLEL_THRESHOLD pages sont découpés en plages de
+# pages extraites en parallèle par un pool de PDF_EXTRACTION_WORKERS processus.
+# Le worker d'extraction tourne en threads (-P threads) : ses
+# CELERY_EXTRACTION_CONCURRENCY tâches partagent un seul pool et occupent
+# ensemble un cœur (GIL), le pool reçoit les autres. Un enfant de worker
+# prefork (processus démon) ne peut pas créer ce pool : l'extraction y reste
+# séquentielle.
+PDF_PARALLEL_THRESHOLD = int(os.getenv('PDF_PARALLEL_THRESHOLD', '100'))
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', str(max((os.cpu_count() or 1) - 1, 1))))
 
 # Mayan EDMS Configuration
 MAYAN_HOST = os.getenv('MAYAN_HOST', 'http://mayan:8000')
@@ -195,6 +276,15 @@ MAYAN_API_URL = os.getenv('MAYAN_API_URL', 'http://mayan:8000/api/v4')
 MAYAN_USERNAME = os.getenv('MAYAN_USERNAME', 'admin')
 MAYAN_PASSWORD = os.getenv('MAYAN_PASSWORD', 'admin')
 
+# Cache (Redis, partagé entre les processus web et les workers Celery)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://redis:6379/1'),
+        'KEY_PREFIX': 'esa_tez',
+    }
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://redis:6379/0')
@@ -202,3 +292,91 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+
+# Files des tâches : l'extraction (CPU, disque) et les appels au modèle sont
+# traités par des workers distincts, dimensionnés séparément. Les analyses
+# de masse (documents importés) ont leur propre file LLM, consommée après la
+# file interactive (workers lancés avec -Q llm,llm-bulk)
+CELERY_EXTRACTION_QUEUE = os.getenv('CELERY_EXTRACTION_QUEUE', 'extraction')
+CELERY_LLM_QUEUE = os.getenv('CELERY_LLM_QUEUE', 'llm')
+CELERY_BULK_LLM_QUEUE = os.getenv('CELERY_BULK_LLM_QUEUE', 'llm-bulk')
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Files consommées dans l'ordre donné au worker, et non à tour de rôle
+    'queue_order_strategy': 'priority',
+}
+CELERY_TASK_ROUTES = {
+    'apps.documents.tasks.ingest_document_task': {'queue': CELERY_EXTRACTION_QUEUE},
+    'apps.documents.tasks.prepare_analysis_task': {'queue': CELERY_EXTRACTION_QUEUE},
+    'apps.documents.tasks.summarize_document_task': {'queue': CELERY_LLM_QUEUE},
+    'apps.documents.tasks.extract_keywords_task': {'queue': CELERY_LLM_QUEUE},
+    'apps.documents.tasks.save_analysis_task': {'queue': CELERY_EXTRACTION_QUEUE},
+    'apps.documents.tasks.dispatch_bulk_analyses_task': {'queue': CELERY_EXTRACTION_QUEUE},
+    'apps.documents.tasks.backfill_analyses_task': {'queue': CELERY_EXTRACTION_QUEUE},
+    'apps.documents.tasks.cleanup_upload_sessions_task': {'queue': CELERY_EXTRACTION_QUEUE},
+    'apps.documents.tasks.warm_up_model_task': {'queue': CELERY_LLM_QUEUE},
+}
+
+# Contrôle d'admission des analyses : au-delà de la profondeur de file ou de
+# l'attente estimée (secondes), l'analyse est reportée aux heures creuses
+# ('defer'), refusée avec un 429 ('reject') ou admise quand même ('off')
+ADMISSION_UPLOAD_POLICY = os.getenv('ADMISSION_UPLOAD_POLICY', 'defer')
+ADMISSION_ANALYZE_POLICY = os.getenv('ADMISSION_ANALYZE_POLICY', 'reject')
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', '500'))
+ADMISSION_MAX_WAIT = int(os.getenv('ADMISSION_MAX_WAIT', '1800'))
+# Durée d'une analyse retenue avant la première mesure (secondes)
+ADMISSION_DEFAULT_DURATION = int(os.getenv('ADMISSION_DEFAULT_DURATION', '60'))
+
+# Lancement des analyses de masse en attente (secondes), en plus du
+# lancement à chaque mise en file et à la fin de chaque analyse
+ANALYSIS_DISPATCH_INTERVAL = int(os.getenv('ANALYSIS_DISPATCH_INTERVAL', '30'))
+
+# Rattrapage des analyses absentes ou périmées (commande backfill_analyses) :
+# plages horaires et jours (syntaxe crontab), intervalle entre deux lots
+# (minutes) et nombre maximal de documents en file d'attente
+ANALYSIS_BACKFILL_HOURS = os.getenv('ANALYSIS_BACKFILL_HOURS', '0-5,20-23')
+ANALYSIS_BACKFILL_DAYS = os.getenv('ANALYSIS_BACKFILL_DAYS', '*')
+ANALYSIS_BACKFILL_INTERVAL = int(os.getenv('ANALYSIS_BACKFILL_INTERVAL', '5'))
+ANALYSIS_BACKFILL_BATCH_SIZE = int(os.getenv('ANALYSIS_BACKFILL_BATCH_SIZE', '20'))
+
+# Tâches périodiques (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-bulk-analyses': {
+        'task': 'apps.documents.tasks.dispatch_bulk_analyses_task',
+        'schedule': ANALYSIS_DISPATCH_INTERVAL,
+    },
+    'backfill-analyses': {
+        'task': 'apps.documents.tasks.backfill_analyses_task',
+        'schedule': crontab(
+            minute=f'*/{ANALYSIS_BACKFILL_INTERVAL}',
+            hour=ANALYSIS_BACKFILL_HOURS,
+            day_of_week=ANALYSIS_BACKFILL_DAYS,
+        ),
+    },
+    'cleanup-upload-sessions': {
+        'task': 'apps.documents.tasks.cleanup_upload_sessions_task',
+        'schedule': crontab(minute=0),
+    },
+}
+if OLLAMA_KEEP_WARM:
+    CELERY_BEAT_SCHEDULE['warm-up-ollama-model'] = {
+        'task': 'apps.documents.tasks.warm_up_model_task',
+        'schedule': crontab(
+            minute=f'*/{OLLAMA_WARM_UP_INTERVAL}',
+            hour=f'{OLLAMA_BUSINESS_START_HOUR}-{OLLAMA_BUSINESS_END_HOUR - 1}',
+            day_of_week=OLLAMA_BUSINESS_DAYS,
+        ),
+    }
+
+# Durée maximale d'une étape d'analyse IA (secondes) : les appels au modèle
+# sont annulés à l'échéance et l'étape est relancée
+ANALYSIS_TIME_LIMIT = int(os.getenv('ANALYSIS_TIME_LIMIT', '600'))
+
+# Conservation des résultats intermédiaires d'une analyse inachevée (secondes)
+ANALYSIS_CHECKPOINT_TTL = int(os.getenv('ANALYSIS_CHECKPOINT_TTL', '86400'))
+
+# Suivi d'une analyse en direct (SSE) : intervalle de lecture de l'état et
+# durée maximale du flux (secondes). Chaque flux ouvert occupe un worker
+# (ou thread) du serveur web pendant toute sa durée : au-delà, le client
+# rouvre le flux ou interroge /tasks/{id}/.
+ANALYSIS_EVENTS_POLL_INTERVAL = float(os.getenv('ANALYSIS_EVENTS_POLL_INTERVAL', '1'))
+ANALYSIS_EVENTS_TIMEOUT = int(os.getenv('ANALYSIS_EVENTS_TIMEOUT', '300'))
@@ -0,0 +1,122 @@
+"""
+Contrôle d'admission des analyses IA : file d'attente, latence et contre-pression
+"""
+import math
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class AdmissionService:
+    """
+    Décide si une nouvelle analyse peut entrer dans le système
+    
+    L'attente estimée d'une analyse est le nombre de tours de serveurs
+    Ollama à attendre (analyses devant elle / places disponibles) multiplié
+    par la durée moyenne d'une analyse, mesurée en continu (moyenne mobile
+    exponentielle). Au-delà de la profondeur ou de l'attente maximale, selon
+    la politique :
+    - 'defer' : l'analyse est reportée aux heures creuses ;
+    - 'reject' : la requête est refusée (429 avec Retry-After) ;
+    - 'off' : aucun contrôle.
+    """
+    
+    POLICY_OFF = 'off'
+    POLICY_DEFER = 'defer'
+    POLICY_REJECT = 'reject'
+    
+    ADMIT = 'admit'
+    DEFER = 'defer'
+    REJECT = 'reject'
+    
+    # Durée moyenne d'une analyse (cache partagé par les workers)
+    DURATION_KEY = 'admission:analysis-duration'
+    
+    # Poids de la dernière mesure dans la moyenne mobile
+    DURATION_SMOOTHING = 0.2
+    
+    @classmethod
+    def record_duration(cls, seconds: float):
+        """Intègre la durée d'une analyse terminée à la moyenne mobile"""
+        average = cache.get(cls.DURATION_KEY)
+        if average is not None:
+            seconds = average + cls.DURATION_SMOOTHING * (seconds - average)
+        cache.set(cls.DURATION_KEY, seconds, None)
+    
+    @classmethod
+    def get_average_duration(cls) -> float:
+        """Durée moyenne d'une analyse (secondes), estimée avant la première mesure"""
+        average = cache.get(cls.DURATION_KEY)
+        return average if average is not None else settings.ADMISSION_DEFAULT_DURATION
+    
+    @classmethod
+    def get_load(cls, queue_depth: int, capacity: int) -> Dict:
+        """
+        Charge de la file d'analyse vue par une nouvelle analyse
+        
+        Args:
+            queue_depth: Analyses en attente ou en cours devant elle
+            capacity: Places des serveurs Ollama sains
+        
+        Returns:
+            Dict avec queue_depth, capacity, average_duration,
+            estimated_wait (secondes, None si aucun serveur n'est
+            disponible) et saturated
+        """
+        average = cls.get_average_duration()
+        estimated_wait = None
+        if capacity > 0:
+            estimated_wait = math.floor(queue_depth / capacity) * average
+        
+        saturated = (
+            estimated_wait is None
+            or queue_depth >= settings.ADMISSION_MAX_QUEUE_DEPTH
+            or estimated_wait >= settings.ADMISSION_MAX_WAIT
+        )
+        
+        return {
+            'queue_depth': queue_depth,
+            'capacity': capacity,
+            'average_duration': round(average),
+            'estimated_wait': None if estimated_wait is None else round(estimated_wait),
+            'saturated': saturated,
+        }
+    
+    @classmethod
+    def decide(cls, load: Dict, policy: str) -> str:
+        """
+        Sort d'une nouvelle analyse
+        
+        Args:
+            load: Charge de la file (get_load)
+            policy: 'off', 'defer' ou 'reject'
+        
+        Returns:
+            ADMIT, DEFER ou REJECT
+        """
+        if not load['saturated'] or policy == cls.POLICY_OFF:
+            return cls.ADMIT
+        if policy == cls.POLICY_DEFER:
+            return cls.DEFER
+        return cls.REJECT
+    
+    @classmethod
+    def get_retry_after(cls, load: Dict) -> int:
+        """
+        Délai (secondes) après lequel une analyse refusée a des chances d'être admise
+        
+        Temps nécessaire pour que la file redescende sous les seuils, au
+        rythme de capacity analyses par durée moyenne.
+        """
+        if load['estimated_wait'] is None:
+            return settings.OLLAMA_CIRCUIT_RECOVERY_TIMEOUT
+        
+        average = max(cls.get_average_duration(), 1)
+        capacity = load['capacity']
+        allowed_depth = min(
+            settings.ADMISSION_MAX_QUEUE_DEPTH - 1,
+            math.ceil(settings.ADMISSION_MAX_WAIT / average) * capacity - 1,
+        )
+        excess = max(load['queue_depth'] - allowed_depth, 1)
+        return max(1, math.ceil(excess / capacity * average))
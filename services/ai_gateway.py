@@ -0,0 +1,284 @@
+"""
+Passerelle IA : regroupement des requêtes generate de tous les workers
+"""
+import asyncio
+import json
+import logging
+import signal
+import time
+import uuid
+from typing import Dict, List, Optional, Union
+
+from services.async_ai_client import AsyncOllamaPool, DeadlineExceeded
+from services.ollama_router import is_connection_error
+
+try:
+    import ollama
+    import redis
+    import redis.asyncio as aioredis
+    GATEWAY_AVAILABLE = True
+except ImportError:
+    GATEWAY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# File Redis des requêtes en attente, liste des réponses d'un appel et
+# signal de vie de la passerelle (expire si elle s'arrête)
+REQUEST_QUEUE_KEY = 'ai:gateway:requests'
+REPLY_KEY = 'ai:gateway:reply:{}'
+HEARTBEAT_KEY = 'ai:gateway:alive'
+HEARTBEAT_TTL = 10
+
+# Erreurs transmises aux workers, par type
+ERROR_DEADLINE = 'deadline'
+ERROR_CONNECTION = 'connection'
+ERROR_RESPONSE = 'response'
+ERROR_OTHER = 'error'
+
+
+def encode_error(error: Exception) -> Dict:
+    """Erreur d'une requête, sous une forme transmissible au worker"""
+    if isinstance(error, DeadlineExceeded):
+        error_type = ERROR_DEADLINE
+    elif isinstance(error, ollama.ResponseError):
+        return {'error': error.error, 'error_type': ERROR_RESPONSE, 'status_code': error.status_code}
+    elif isinstance(error, ConnectionError) or is_connection_error(error):
+        error_type = ERROR_CONNECTION
+    else:
+        error_type = ERROR_OTHER
+    return {'error': str(error), 'error_type': error_type}
+
+
+def decode_error(reply: Dict) -> Exception:
+    """Exception équivalente à l'erreur renvoyée par la passerelle"""
+    if reply['error_type'] == ERROR_RESPONSE:
+        return ollama.ResponseError(reply['error'], reply['status_code'])
+    if reply['error_type'] == ERROR_DEADLINE:
+        return DeadlineExceeded(reply['error'])
+    if reply['error_type'] == ERROR_CONNECTION:
+        return ConnectionError(reply['error'])
+    return RuntimeError(reply['error'])
+
+
+class AIGatewayClient:
+    """
+    Envoi de requêtes generate à la passerelle IA depuis un worker
+    
+    Les requêtes sont déposées dans une file Redis commune à tous les
+    workers ; les réponses reviennent dans une liste propre à l'appel.
+    Chaque requête porte son échéance : la passerelle abandonne celles
+    dont le demandeur n'attend plus la réponse.
+    """
+    
+    # Durée pendant laquelle l'état de la passerelle est réutilisé (secondes)
+    CHECK_INTERVAL = 1
+    
+    def __init__(self, redis_url: str, timeout: float):
+        self.redis_url = redis_url
+        self.timeout = timeout
+        self._redis = None
+        self._running = False
+        self._checked_at = 0.0
+    
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+    
+    def is_running(self) -> bool:
+        """La passerelle a signalé son activité depuis moins de HEARTBEAT_TTL secondes"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.CHECK_INTERVAL:
+            try:
+                self._running = bool(self.redis.exists(HEARTBEAT_KEY))
+            except redis.RedisError as e:
+                logger.warning(f"Passerelle IA injoignable: {e}")
+                self._running = False
+            self._checked_at = now
+        return self._running
+    
+    def generate_many(self, requests: List[Dict],
+                      deadline: Optional[float] = None) -> List[Union[Dict, Exception]]:
+        """
+        Confie des requêtes generate à la passerelle et attend leurs réponses
+        
+        Args:
+            requests: Paramètres de chaque requête generate
+            deadline: Échéance absolue (time.monotonic()) commune aux
+                requêtes ; à défaut, timeout secondes
+        
+        Returns:
+            Réponse ou exception de chaque requête, dans l'ordre des requêtes
+            (DeadlineExceeded pour les requêtes restées sans réponse)
+        """
+        timeout = self.timeout if deadline is None else deadline - time.monotonic()
+        results = [
+            DeadlineExceeded("Pas de réponse de la passerelle IA avant l'échéance")
+            for _ in requests
+        ]
+        if timeout <= 0:
+            return results
+        
+        reply_key = REPLY_KEY.format(uuid.uuid4().hex)
+        expires_at = time.time() + timeout
+        give_up_at = time.monotonic() + timeout
+        
+        self.redis.rpush(REQUEST_QUEUE_KEY, *(
+            json.dumps({
+                'reply_to': reply_key,
+                'index': index,
+                'expires_at': expires_at,
+                'request': request,
+            })
+            for index, request in enumerate(requests)
+        ))
+        
+        try:
+            for _ in requests:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                item = self.redis.blpop(reply_key, timeout=remaining)
+                if item is None:
+                    break
+                reply = json.loads(item[1])
+                results[reply['index']] = reply['response'] if 'response' in reply else decode_error(reply)
+        finally:
+            self.redis.delete(reply_key)
+        
+        return results
+
+
+class AIGateway:
+    """
+    Passerelle entre les workers et les serveurs Ollama
+    
+    Un processus Celery n'envoie ses requêtes qu'une à une : avec plusieurs
+    places par serveur (OLLAMA_HOST_SLOTS, OLLAMA_NUM_PARALLEL côté
+    Ollama), une partie des places reste inoccupée. La passerelle reçoit
+    les requêtes de tous les workers et en garde en vol autant que les
+    serveurs ont de places. Quand des places se libèrent, elle attend au
+    plus max_wait secondes que d'autres requêtes arrivent pour les envoyer
+    ensemble (au plus max_batch) : leurs générations avancent dans les
+    mêmes passes de décodage du modèle.
+    
+    Utilisation :
+        asyncio.run(AIGateway(router, redis_url).run())
+    """
+    
+    # Attente d'une requête avant de vérifier l'arrêt demandé (secondes)
+    POLL_TIMEOUT = 1
+    
+    def __init__(self, router, redis_url: str, max_batch: int = 8, max_wait: float = 0.05,
+                 timeout: Optional[float] = None):
+        self.router = router
+        self.redis_url = redis_url
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.concurrency = max(router.capacity, 1)
+        self.stats = {'requests': 0, 'batches': 0, 'expired': 0}
+        self._redis = None
+        self._slots = None
+        self._stopping = False
+    
+    def stop(self):
+        """Demande l'arrêt : les requêtes en vol sont menées à terme"""
+        self._stopping = True
+    
+    async def run(self):
+        """Traite les requêtes des workers jusqu'à l'arrêt demandé"""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+        
+        self._redis = aioredis.Redis.from_url(self.redis_url)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        pending = set()
+        logger.info(
+            f"Passerelle IA démarrée: {self.concurrency} place(s), lots de {self.max_batch} "
+            f"requête(s) au plus, attente maximale {self.max_wait * 1000:.0f} ms"
+        )
+        
+        try:
+            async with AsyncOllamaPool(self.router, self.concurrency, self.timeout) as pool:
+                while not self._stopping:
+                    batch = await self._collect_batch()
+                    if not batch:
+                        continue
+                    self.stats['batches'] += 1
+                    self.stats['requests'] += len(batch)
+                    logger.debug(f"Lot de {len(batch)} requête(s) envoyé à Ollama")
+                    for payload in batch:
+                        task = asyncio.create_task(self._handle(pool, payload))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                
+                if pending:
+                    await asyncio.wait(pending)
+        finally:
+            heartbeat.cancel()
+            await self._redis.delete(HEARTBEAT_KEY)
+            await self._redis.aclose()
+            logger.info(f"Passerelle IA arrêtée: {self.stats}")
+    
+    async def _heartbeat(self):
+        """Signale aux workers que la passerelle est active"""
+        while True:
+            await self._redis.set(HEARTBEAT_KEY, 1, ex=HEARTBEAT_TTL)
+            await asyncio.sleep(HEARTBEAT_TTL / 3)
+    
+    async def _collect_batch(self) -> List[bytes]:
+        """
+        Retire de la file un lot de requêtes, une par place libre
+        
+        Attend une place libre et une première requête, puis les requêtes
+        arrivées dans les max_wait secondes suivantes, tant qu'il reste des
+        places et que le lot n'est pas complet.
+        """
+        await self._slots.acquire()
+        item = await self._redis.blpop(REQUEST_QUEUE_KEY, timeout=self.POLL_TIMEOUT)
+        if item is None:
+            self._slots.release()
+            return []
+        
+        batch = [item[1]]
+        collect_until = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch and not self._slots.locked():
+            remaining = collect_until - time.monotonic()
+            # Au-delà de la fenêtre, seules les requêtes déjà en file sont prises
+            item = await (
+                self._redis.blpop(REQUEST_QUEUE_KEY, timeout=remaining) if remaining > 0
+                else self._redis.lpop(REQUEST_QUEUE_KEY)
+            )
+            if item is None:
+                break
+            await self._slots.acquire()
+            batch.append(item[1] if isinstance(item, (list, tuple)) else item)
+        return batch
+    
+    async def _handle(self, pool: AsyncOllamaPool, payload: bytes):
+        """Exécute une requête et renvoie sa réponse (ou son erreur) au worker"""
+        try:
+            message = json.loads(payload)
+            reply = {'index': message['index']}
+            remaining = message['expires_at'] - time.time()
+            try:
+                if remaining <= 0:
+                    self.stats['expired'] += 1
+                    raise DeadlineExceeded("Échéance dépassée dans la file de la passerelle IA")
+                reply['response'] = dict(await pool.generate(
+                    deadline=time.monotonic() + remaining,
+                    **message['request']
+                ))
+            except Exception as e:
+                reply.update(encode_error(e))
+            
+            await self._redis.rpush(message['reply_to'], json.dumps(reply))
+            await self._redis.expire(message['reply_to'], max(int(remaining), 0) + HEARTBEAT_TTL)
+        except Exception as e:
+            logger.error(f"Réponse de la passerelle IA non transmise: {e}")
+        finally:
+            self._slots.release()
@@ -1,16 +1,24 @@
 """
 Service d'analyse IA avec Ollama/Mistral
 """
+import re
+import json
+import hashlib
 import logging
 import time
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Union
+from celery.schedules import crontab_parser
 from django.conf import settings
+from django.utils import timezone
 
-try:
-    import ollama
-    OLLAMA_AVAILABLE = True
-except ImportError:
-    OLLAMA_AVAILABLE = False
+from services.ai_gateway import GATEWAY_AVAILABLE, AIGatewayClient
+from services.async_ai_client import AsyncOllamaRunner, DeadlineExceeded
+from services.extractive_service import ExtractiveService
+from services.llm_cache import LLMResponseCache
+from services.ollama_router import OLLAMA_AVAILABLE, OllamaRouter, is_connection_error
+
+if not OLLAMA_AVAILABLE:
     logging.warning("Ollama package not installed. AI features will be disabled.")
 
 logger = logging.getLogger(__name__)
@@ -19,49 +27,276 @@ logger = logging.getLogger(__name__)
 class AIService:
     """Service pour l'analyse de documents avec Mistral via Ollama"""
     
+    # Taille maximale du texte envoyé au modèle (en caractères)
+    MAX_TEXT_LENGTH = 4000
+    
+    # Estimation du nombre de caractères par token
+    CHARS_PER_TOKEN = 4
+    
+    # Résumé hiérarchique : longueur des résumés intermédiaires et nombre
+    # maximum de niveaux de réduction
+    CHUNK_SUMMARY_WORDS = 80
+    MAX_REDUCE_DEPTH = 3
+    
+    # Version des prompts d'analyse : à incrémenter à chaque modification
+    # des prompts pour que les documents soient réanalysés
+    PROMPT_VERSION = 1
+    
     def __init__(self):
         self.model = settings.OLLAMA_MODEL
-        self.host = settings.OLLAMA_HOST
+        self.hosts = settings.OLLAMA_HOSTS
         self.timeout = settings.OLLAMA_TIMEOUT
+        self.combined_analysis = settings.OLLAMA_COMBINED_ANALYSIS
+        self.map_reduce = settings.OLLAMA_MAP_REDUCE
+        self.chunk_tokens = settings.OLLAMA_CHUNK_TOKENS
+        self.concurrency = settings.OLLAMA_CONCURRENCY
+        self.extractive = settings.OLLAMA_EXTRACTIVE_ENABLED
+        self.saturation_backlog = settings.OLLAMA_SATURATION_BACKLOG
+        
+        # Maintien du modèle en mémoire : keep_alive par défaut, prolongé
+        # jusqu'à la fin des heures ouvrées
+        self.keep_alive = settings.OLLAMA_KEEP_ALIVE
+        self.keep_warm = settings.OLLAMA_KEEP_WARM
+        self.business_start_hour = settings.OLLAMA_BUSINESS_START_HOUR
+        self.business_end_hour = settings.OLLAMA_BUSINESS_END_HOUR
+        self.business_days = crontab_parser(7).parse(settings.OLLAMA_BUSINESS_DAYS)
+        
+        # Cache des réponses (prompts identiques : relances, doublons, réanalyses)
+        self.response_cache = None
+        if settings.OLLAMA_CACHE_ENABLED:
+            self.response_cache = LLMResponseCache(
+                ttl=settings.OLLAMA_CACHE_TTL,
+                max_entries=settings.OLLAMA_CACHE_LOCAL_MAX_ENTRIES,
+            )
         
+        # Serveurs Ollama : répartition et état de santé partagés par tous
+        # les appels du processus
+        self.health_ttl = settings.OLLAMA_HEALTH_TTL
         if OLLAMA_AVAILABLE:
-            self.client = ollama.Client(host=self.host)
+            self.router = OllamaRouter(
+                self.hosts,
+                failure_threshold=settings.OLLAMA_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=settings.OLLAMA_CIRCUIT_RECOVERY_TIMEOUT,
+                host_slots=settings.OLLAMA_HOST_SLOTS,
+                keep_alive=settings.OLLAMA_KEEP_ALIVE,
+                timeout=self.timeout,
+            )
+            # Requêtes asynchrones : boucle et connexions conservées par processus
+            self.async_runner = AsyncOllamaRunner(self.router, self.concurrency, self.timeout)
         else:
-            self.client = None
+            self.router = None
             logger.warning("Ollama client not available")
+        
+        # Passerelle IA (commande run_ai_gateway) : requêtes regroupées avec
+        # celles des autres workers ; appels directs si elle ne tourne pas
+        self.gateway = None
+        if settings.OLLAMA_GATEWAY_ENABLED and OLLAMA_AVAILABLE and GATEWAY_AVAILABLE:
+            self.gateway = AIGatewayClient(settings.OLLAMA_GATEWAY_REDIS_URL, settings.OLLAMA_GATEWAY_TIMEOUT)
     
     def is_available(self) -> bool:
-        """Vérifie si le service IA est disponible"""
-        if not OLLAMA_AVAILABLE or not self.client:
-            return False
+        """
+        Vérifie si le service IA est disponible (au moins un serveur Ollama répond)
         
-        try:
-            # Test de connexion simple
-            self.client.list()
-            return True
-        except Exception as e:
-            logger.error(f"Service Ollama non disponible: {e}")
+        Le résultat d'une vérification réussie est réutilisé pendant
+        health_ttl secondes. Les serveurs dont le disjoncteur est ouvert ne
+        sont pas interrogés.
+        """
+        if not OLLAMA_AVAILABLE or not self.router:
             return False
+        
+        return self.router.is_available(self.health_ttl)
+    
+    @staticmethod
+    def _cache_key(request: Dict) -> str:
+        """Clé de cache d'une requête generate (le streaming et le keep_alive n'en font pas partie)"""
+        params = {
+            name: value for name, value in request.items()
+            if name not in ('model', 'prompt', 'stream', 'keep_alive')
+        }
+        return LLMResponseCache.make_key(request.get('model', ''), request.get('prompt', ''), **params)
+    
+    @staticmethod
+    def _check_deadline(deadline: Optional[float]):
+        """Lève DeadlineExceeded si l'échéance est déjà dépassée"""
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("Budget de temps de l'analyse épuisé")
     
-    def generate_summary(self, text: str, max_words: int = 150) -> str:
+    def use_gateway(self) -> bool:
+        """Les requêtes generate passent par la passerelle IA"""
+        return self.gateway is not None and self.gateway.is_running()
+    
+    def _generate(self, use_cache: bool = True, deadline: Optional[float] = None,
+                  refresh_cache: bool = False, **kwargs) -> Dict:
         """
-        Génère un résumé concis d'un texte
+        Appelle generate sur le serveur Ollama choisi par le routeur
+        
+        Les réponses sont mises en cache par modèle, prompt et options : une
+        requête déjà traitée ne repasse pas par le modèle.
         
         Args:
-            text: Texte à résumer
-            max_words: Nombre maximum de mots dans le résumé
+            use_cache: Consulter et alimenter le cache des réponses
+            deadline: Échéance absolue (time.monotonic()) de l'appel
+            refresh_cache: Ignorer les réponses en cache (analyse forcée) ;
+                la nouvelle réponse y est enregistrée
+            **kwargs: Paramètres de client.generate
+            
+        Raises:
+            ConnectionError si aucun serveur n'est disponible
+            DeadlineExceeded si l'échéance est dépassée (requête annulée)
+        """
+        kwargs.setdefault('keep_alive', self.get_keep_alive())
+        
+        if deadline is not None or self.use_gateway():
+            # Seul le client asynchrone permet d'annuler la requête en cours ;
+            # la passerelle reçoit les requêtes par lots
+            response = self.generate_many([kwargs], deadline, use_cache, refresh_cache)[0]
+            if isinstance(response, Exception):
+                raise response
+            return response
+        
+        cache_key = None
+        if use_cache and self.response_cache is not None:
+            cache_key = self._cache_key(kwargs)
+            cached = None if refresh_cache else self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        response = self.router.call(
+            kwargs.get('model', ''),
+            lambda host: host.client.generate(**kwargs),
+            kwargs['keep_alive']
+        )
+        
+        if cache_key is not None and response.get('response', '').strip():
+            self.response_cache.set(cache_key, {'response': response['response']})
+        
+        return response
+    
+    def generate_many(self, requests: List[Dict], deadline: Optional[float] = None,
+                      use_cache: bool = True, refresh_cache: bool = False) -> List[Union[Dict, Exception]]:
+        """
+        Exécute plusieurs requêtes generate en parallèle depuis du code synchrone
+        
+        Les requêtes déjà en cache ne sont pas envoyées ; les autres sont
+        confiées à la passerelle IA si elle tourne, sinon au pool
+        asynchrone permanent du processus (AsyncOllamaRunner), qui réutilise
+        ses connexions d'un appel à l'autre et garde au plus `concurrency`
+        requêtes en vol pour tout le processus.
+        
+        Args:
+            requests: Paramètres de chaque requête generate
+            deadline: Échéance absolue (time.monotonic()) commune aux requêtes
+            use_cache: Consulter et alimenter le cache des réponses
+            refresh_cache: Ignorer les réponses en cache (analyse forcée) ;
+                la nouvelle réponse y est enregistrée
             
         Returns:
-            Résumé généré
+            Réponse ou exception de chaque requête, dans l'ordre des requêtes.
+            Les réponses obtenues avant l'échéance sont mises en cache : une
+            nouvelle tentative ne renvoie que les requêtes manquantes.
         """
-        if not self.is_available():
-            return "Service d'IA non disponible"
+        use_cache = use_cache and self.response_cache is not None
+        results = [None] * len(requests)
+        pending = []
         
-        if not text or len(text.strip()) < 100:
-            return "Texte trop court pour générer un résumé"
+        for index, request in enumerate(requests):
+            cached = None
+            if use_cache and not refresh_cache:
+                cached = self.response_cache.get(self._cache_key(request))
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append(index)
+        
+        if not pending:
+            return results
+        
+        keep_alive = self.get_keep_alive()
+        pending_requests = [dict({'keep_alive': keep_alive}, **requests[index]) for index in pending]
+        
+        if self.use_gateway():
+            responses = self.gateway.generate_many(pending_requests, deadline)
+        elif self.router.is_open:
+            error = ConnectionError("Service Ollama indisponible (aucun serveur disponible)")
+            for index in pending:
+                results[index] = error
+            return results
+        else:
+            responses = self.async_runner.generate_many(pending_requests, deadline)
+        
+        for index, response in zip(pending, responses):
+            results[index] = response
+            if isinstance(response, Exception):
+                continue
+            if use_cache and response.get('response', '').strip():
+                self.response_cache.set(
+                    self._cache_key(requests[index]),
+                    {'response': response['response']}
+                )
+        
+        return results
+    
+    def get_fingerprint(self, text: str, **options) -> str:
+        """
+        Empreinte des entrées d'une analyse
+        
+        Deux analyses de même empreinte portent sur le même texte, avec le
+        même modèle, la même version des prompts et les mêmes options : la
+        seconde peut être évitée.
+        
+        Args:
+            text: Texte analysé
+            **options: Options de l'appelant influant sur le résultat
+            
+        Returns:
+            Empreinte SHA-256 (hexadécimale)
+        """
+        return self.get_fingerprint_from_hash(hashlib.sha256(text.encode('utf-8')).hexdigest(), **options)
+    
+    def get_fingerprint_from_hash(self, text_hash: str, **options) -> str:
+        """Empreinte des entrées d'une analyse, à partir de l'empreinte SHA-256 du texte (voir get_fingerprint)"""
+        payload = json.dumps({
+            'text': text_hash,
+            'model': self.model,
+            'prompt_version': self.PROMPT_VERSION,
+            'options': {
+                'combined_analysis': self.combined_analysis,
+                'map_reduce': self.map_reduce,
+                'chunk_tokens': self.chunk_tokens,
+                'extractive': self.extractive,
+                'extractive_budget': [
+                    settings.OLLAMA_EXTRACTIVE_RATIO,
+                    settings.OLLAMA_EXTRACTIVE_MIN_TOKENS,
+                    settings.OLLAMA_EXTRACTIVE_MAX_TOKENS,
+                ],
+                **options,
+            },
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _text_sample(self, text: str) -> str:
+        """
+        Texte envoyé au modèle pour un document
+        
+        Avec le pré-résumé extractif, il s'agit des phrases les plus
+        informatives de tout le document, dans un budget qui dépend de sa
+        taille ; sinon, du début du document.
+        """
+        if not self.extractive:
+            return text[:self.MAX_TEXT_LENGTH]
         
-        # Limiter la taille du texte envoyé (4000 caractères max)
-        text_sample = text[:4000]
+        budget = ExtractiveService.get_budget(
+            len(text),
+            ratio=settings.OLLAMA_EXTRACTIVE_RATIO,
+            min_chars=settings.OLLAMA_EXTRACTIVE_MIN_TOKENS * self.CHARS_PER_TOKEN,
+            max_chars=min(settings.OLLAMA_EXTRACTIVE_MAX_TOKENS * self.CHARS_PER_TOKEN, self.MAX_TEXT_LENGTH),
+        )
+        return ExtractiveService.summarize(text, budget)
+    
+    def _summary_request(self, text: str, max_words: int) -> Dict:
+        """Paramètres de la requête de résumé d'un document"""
+        # Limiter la taille du texte envoyé
+        text_sample = self._text_sample(text)
         
         prompt = f"""Tu es un assistant spécialisé dans l'analyse de documents.
 Génère un résumé concis et pertinent en français du document suivant (maximum {max_words} mots).
@@ -72,47 +307,86 @@ Document:
 
 Résumé:"""
         
-        try:
-            start_time = time.time()
-            
-            response = self.client.generate(
-                model=self.model,
-                prompt=prompt,
-                options={
-                    'temperature': 0.3,
-                    'num_predict': max_words * 2,  # Approximation mots -> tokens
-                }
-            )
-            
-            elapsed_time = time.time() - start_time
-            logger.info(f"Résumé généré en {elapsed_time:.2f}s")
+        return {
+            'model': self.model,
+            'prompt': prompt,
+            'options': {
+                'temperature': 0.3,
+                'num_predict': max_words * 2,  # Approximation mots -> tokens
+            },
+        }
+    
+    def generate_summary(self, text: str, max_words: int = 150,
+                         deadline: Optional[float] = None, refresh_cache: bool = False) -> str:
+        """
+        Génère un résumé concis d'un texte
+        
+        Args:
+            text: Texte à résumer
+            max_words: Nombre maximum de mots dans le résumé
+            deadline: Échéance absolue (time.monotonic()) de l'appel
+            refresh_cache: Ne pas reprendre les réponses en cache (analyse forcée)
             
-            summary = response['response'].strip()
-            return summary if summary else "Impossible de générer un résumé"
+        Returns:
+            Résumé généré
             
-        except Exception as e:
-            logger.error(f"Erreur lors de la génération du résumé: {e}")
-            return f"Erreur lors de la génération du résumé: {str(e)}"
+        Raises:
+            ConnectionError si Ollama est indisponible
+            DeadlineExceeded si l'échéance est dépassée
+            RuntimeError si le modèle renvoie un résumé vide ; les erreurs
+            de l'appel au modèle sont propagées, jamais renvoyées comme
+            résumé
+        """
+        if not self.is_available():
+            raise ConnectionError("Service d'IA non disponible")
+        
+        if not text or len(text.strip()) < 100:
+            return "Texte trop court pour générer un résumé"
+        
+        start_time = time.time()
+        
+        response = self._generate(
+            deadline=deadline,
+            refresh_cache=refresh_cache,
+            **self._summary_request(text, max_words)
+        )
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"Résumé généré en {elapsed_time:.2f}s")
+        
+        summary = response['response'].strip()
+        if not summary:
+            raise RuntimeError("Le modèle a renvoyé un résumé vide")
+        return summary
     
-    def extract_keywords(self, text: str, num_keywords: int = 7) -> List[str]:
+    def extract_keywords(self, text: str, num_keywords: int = 7,
+                         deadline: Optional[float] = None, refresh_cache: bool = False) -> List[str]:
         """
         Extrait les mots-clés principaux d'un texte
         
         Args:
             text: Texte à analyser
             num_keywords: Nombre de mots-clés à extraire
+            deadline: Échéance absolue (time.monotonic()) de l'appel
+            refresh_cache: Ne pas reprendre les réponses en cache (analyse forcée)
             
         Returns:
             Liste de mots-clés
+            
+        Raises:
+            ConnectionError si Ollama est indisponible
+            DeadlineExceeded si l'échéance est dépassée ; les erreurs de
+            l'appel au modèle sont propagées, jamais renvoyées comme
+            mots-clés
         """
         if not self.is_available():
-            return ["Service IA non disponible"]
+            raise ConnectionError("Service d'IA non disponible")
         
         if not text or len(text.strip()) < 100:
             return ["Texte trop court"]
         
         # Limiter la taille du texte
-        text_sample = text[:4000]
+        text_sample = self._text_sample(text)
         
         prompt = f"""Tu es un assistant spécialisé dans l'analyse de documents.
 Extrait exactement {num_keywords} mots-clés ou expressions clés qui représentent les thèmes principaux du document suivant.
@@ -123,71 +397,404 @@ Document:
 
 Mots-clés:"""
         
+        start_time = time.time()
+        
+        response = self._generate(
+            deadline=deadline,
+            refresh_cache=refresh_cache,
+            model=self.model,
+            prompt=prompt,
+            options={
+                'temperature': 0.2,
+                'num_predict': 100,
+            }
+        )
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"Mots-clés extraits en {elapsed_time:.2f}s")
+        
+        keywords_text = response['response'].strip()
+        
+        # Parser la réponse pour extraire les mots-clés
+        return self._clean_keywords(keywords_text.split(','), num_keywords)
+    
+    def stream_summary(self, text: str, max_words: int = 150) -> Iterator[str]:
+        """
+        Génère un résumé en renvoyant les tokens au fur et à mesure
+        
+        Un résumé déjà en cache est renvoyé en un seul morceau. Le résumé
+        complet est mis en cache à la fin du flux.
+        
+        Args:
+            text: Texte à résumer
+            max_words: Nombre maximum de mots dans le résumé
+            
+        Yields:
+            Fragments du résumé
+            
+        Raises:
+            ConnectionError si Ollama est indisponible
+        """
+        if not self.is_available():
+            raise ConnectionError("Service d'IA non disponible")
+        
+        request = self._summary_request(text, max_words)
+        
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self._cache_key(request)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached['response']
+                return
+        
+        request['keep_alive'] = self.get_keep_alive()
+        host = self.router.acquire(request['model'])
+        if host is None:
+            raise ConnectionError("Service Ollama indisponible (aucun serveur disponible)")
+        
+        start_time = time.time()
+        parts = []
+        
+        try:
+            for chunk in host.client.generate(stream=True, **request):
+                token = chunk.get('response', '')
+                if token:
+                    if not parts:
+                        logger.info(f"Premier token du résumé reçu en {time.time() - start_time:.2f}s")
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            self.router.release(host, request['model'], e)
+            raise
+        except GeneratorExit:
+            # Client déconnecté : le flux est abandonné
+            self.router.release(host, request['model'], None, request['keep_alive'])
+            raise
+        
+        self.router.release(host, request['model'], keep_alive=request['keep_alive'])
+        logger.info(f"Résumé diffusé en {time.time() - start_time:.2f}s")
+        
+        summary = ''.join(parts).strip()
+        if cache_key is not None and summary:
+            self.response_cache.set(cache_key, {'response': summary})
+    
+    @staticmethod
+    def _clean_keywords(keywords: List[str], num_keywords: int) -> List[str]:
+        """Nettoie une liste de mots-clés bruts renvoyés par le modèle"""
+        keywords = [str(kw).strip() for kw in keywords]
+        keywords = [kw for kw in keywords if kw and len(kw) > 2]
+        return keywords[:num_keywords]
+    
+    def _parse_combined_response(self, response_text: str, num_keywords: int) -> Optional[Dict]:
+        """
+        Parse la réponse JSON d'une analyse combinée
+        
+        Tolère un texte autour de l'objet JSON et des mots-clés fournis sous
+        forme de chaîne séparée par des virgules.
+        
+        Returns:
+            Dict avec summary et key_points, ou None si la réponse est inexploitable
+        """
+        try:
+            data = json.loads(response_text)
+        except ValueError:
+            match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            if not match:
+                return None
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                return None
+        
+        if not isinstance(data, dict):
+            return None
+        
+        summary = data.get('resume') or data.get('summary') or ''
+        keywords = data.get('mots_cles') or data.get('keywords') or []
+        
+        if isinstance(keywords, str):
+            keywords = keywords.split(',')
+        if not isinstance(summary, str) or not isinstance(keywords, list):
+            return None
+        
+        summary = summary.strip()
+        keywords = self._clean_keywords(keywords, num_keywords)
+        
+        if not summary or not keywords:
+            return None
+        
+        return {
+            'summary': summary,
+            'key_points': keywords,
+        }
+    
+    def generate_combined_analysis(self, text: str, max_words: int = 150, num_keywords: int = 7,
+                                   deadline: Optional[float] = None,
+                                   refresh_cache: bool = False) -> Optional[Dict]:
+        """
+        Génère le résumé et les mots-clés en un seul appel au modèle
+        
+        Le document n'est envoyé qu'une fois et le modèle répond en JSON.
+        
+        Args:
+            text: Texte du document
+            max_words: Nombre maximum de mots dans le résumé
+            num_keywords: Nombre de mots-clés à extraire
+            deadline: Échéance absolue (time.monotonic()) de l'appel
+            refresh_cache: Ne pas reprendre les réponses en cache (analyse forcée)
+            
+        Returns:
+            Dict avec summary et key_points, ou None si l'appel ou le parsing échoue
+            
+        Raises:
+            DeadlineExceeded si l'échéance est dépassée
+        """
+        text_sample = self._text_sample(text)
+        
+        prompt = f"""Tu es un assistant spécialisé dans l'analyse de documents.
+Analyse le document suivant et réponds uniquement avec un objet JSON de la forme :
+{{"resume": "...", "mots_cles": ["...", "..."]}}
+- "resume" : résumé concis et pertinent en français (maximum {max_words} mots) capturant les points principaux et les idées clés.
+- "mots_cles" : exactement {num_keywords} mots-clés ou expressions clés représentant les thèmes principaux.
+
+Document:
+{text_sample}
+
+JSON:"""
+        
         try:
             start_time = time.time()
             
-            response = self.client.generate(
+            response = self._generate(
+                deadline=deadline,
+                refresh_cache=refresh_cache,
                 model=self.model,
                 prompt=prompt,
+                format='json',
                 options={
                     'temperature': 0.2,
-                    'num_predict': 100,
+                    'num_predict': max_words * 2 + 100,
                 }
             )
             
             elapsed_time = time.time() - start_time
-            logger.info(f"Mots-clés extraits en {elapsed_time:.2f}s")
+            logger.info(f"Analyse combinée générée en {elapsed_time:.2f}s")
             
-            keywords_text = response['response'].strip()
+            result = self._parse_combined_response(response['response'].strip(), num_keywords)
+            if result is None:
+                logger.warning("Réponse de l'analyse combinée inexploitable")
+            return result
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Erreur lors de l'analyse combinée: {e}")
+            return None
+    
+    def split_into_chunks(self, text: str, max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Découpe un texte en morceaux d'au plus max_tokens tokens (estimés)
+        
+        Les coupures se font de préférence entre paragraphes, puis entre mots.
+        
+        Args:
+            text: Texte à découper
+            max_tokens: Budget de tokens par morceau
+            
+        Returns:
+            Liste de morceaux
+        """
+        max_chars = (max_tokens or self.chunk_tokens) * self.CHARS_PER_TOKEN
+        chunks = []
+        current = []
+        current_length = 0
+        
+        for paragraph in text.split('\n'):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
             
-            # Parser la réponse pour extraire les mots-clés
-            keywords = [kw.strip() for kw in keywords_text.split(',')]
-            keywords = [kw for kw in keywords if kw and len(kw) > 2]
+            # Paragraphe trop long : le couper entre deux mots
+            while len(paragraph) > max_chars:
+                cut = paragraph.rfind(' ', 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                if current:
+                    chunks.append('\n'.join(current))
+                    current, current_length = [], 0
+                chunks.append(paragraph[:cut].strip())
+                paragraph = paragraph[cut:].strip()
             
-            return keywords[:num_keywords]
+            if current_length + len(paragraph) + 1 > max_chars and current:
+                chunks.append('\n'.join(current))
+                current, current_length = [], 0
+            
+            if paragraph:
+                current.append(paragraph)
+                current_length += len(paragraph) + 1
+        
+        if current:
+            chunks.append('\n'.join(current))
+        
+        return chunks
+    
+    def _chunk_request(self, chunk: str, max_words: int) -> Dict:
+        """Paramètres de la requête de résumé d'un morceau de document"""
+        prompt = f"""Tu es un assistant spécialisé dans l'analyse de documents.
+Voici un extrait d'un document plus long. Résume en français ses informations essentielles (maximum {max_words} mots), sans introduction.
+
+Extrait:
+{chunk}
+
+Résumé:"""
+        
+        return {
+            'model': self.model,
+            'prompt': prompt,
+            'options': {
+                'temperature': 0.3,
+                'num_predict': max_words * 2,
+            },
+        }
+    
+    def summarize_chunks(self, chunks: List[str], max_words: Optional[int] = None,
+                         deadline: Optional[float] = None, refresh_cache: bool = False) -> List[str]:
+        """
+        Résume des morceaux de document (étape « map » du résumé hiérarchique)
+        
+        Les morceaux sont envoyés en parallèle (au plus `concurrency` appels
+        simultanés). Grâce au cache des réponses, une nouvelle analyse ne
+        recalcule que les morceaux qui ont changé.
+        
+        Args:
+            chunks: Morceaux de texte
+            max_words: Nombre maximum de mots de chaque résumé
+            deadline: Échéance absolue (time.monotonic()) des appels
+            refresh_cache: Ne pas reprendre les réponses en cache (analyse forcée)
             
+        Returns:
+            Résumé de chaque morceau
+            
+        Raises:
+            Exception si un morceau n'a pas pu être résumé
+        """
+        max_words = max_words or self.CHUNK_SUMMARY_WORDS
+        responses = self.generate_many(
+            [self._chunk_request(chunk, max_words) for chunk in chunks],
+            deadline,
+            refresh_cache=refresh_cache
+        )
+        
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        
+        return [response['response'].strip() for response in responses]
+    
+    def reduce_text(self, text: str, deadline: Optional[float] = None,
+                    refresh_cache: bool = False) -> Optional[str]:
+        """
+        Réduit un long document à la concaténation des résumés de ses morceaux
+        
+        Les morceaux sont résumés en parallèle, sur plusieurs niveaux si
+        nécessaire, jusqu'à tenir dans la fenêtre envoyée au modèle.
+        
+        Args:
+            text: Texte complet du document
+            deadline: Échéance absolue (time.monotonic()) des appels
+            refresh_cache: Ne pas reprendre les réponses en cache (analyse forcée)
+            
+        Returns:
+            Texte réduit, ou None en cas d'échec
+            
+        Raises:
+            DeadlineExceeded si l'échéance est dépassée
+        """
+        try:
+            depth = 0
+            while len(text) > self.MAX_TEXT_LENGTH and depth < self.MAX_REDUCE_DEPTH:
+                chunks = self.split_into_chunks(text)
+                summaries = self.summarize_chunks(chunks, deadline=deadline, refresh_cache=refresh_cache)
+                text = '\n'.join(summary for summary in summaries if summary)
+                depth += 1
+                logger.info(f"Niveau {depth} du résumé hiérarchique: {len(chunks)} morceaux")
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            logger.error(f"Erreur lors de l'extraction des mots-clés: {e}")
-            return [f"Erreur: {str(e)}"]
+            logger.error(f"Erreur lors du résumé hiérarchique: {e}")
+            return None
+        
+        return text or None
     
-    def analyze_document(self, text: str) -> Dict:
+    def summarize_document(self, text: str, deadline: Optional[float] = None,
+                           with_keywords: bool = True, refresh_cache: bool = False) -> Dict:
         """
-        Analyse complète d'un document (résumé + mots-clés)
+        Étape « résumé » de l'analyse d'un document
+        
+        Un long document est d'abord réduit par résumé hiérarchique. Si
+        with_keywords et que l'analyse combinée est activée, les mots-clés
+        sont obtenus par le même appel que le résumé.
         
         Args:
             text: Texte du document
+            deadline: Échéance absolue (time.monotonic()) des appels
+            with_keywords: Demander aussi les mots-clés
+            refresh_cache: Ne pas reprendre les réponses en cache (analyse
+                forcée) ; les nouvelles réponses y sont enregistrées
             
         Returns:
-            Dict avec summary, key_points, model_used
+            Dict avec summary, key_points (None s'ils restent à extraire),
+            text (texte envoyé au modèle, réduit pour un long document),
+            model_used, error (True si aucun résumé n'a pu être obtenu :
+            le résultat ne doit alors être ni mis en cache ni enregistré)
+            
+        Raises:
+            DeadlineExceeded si l'échéance est dépassée
         """
-        logger.info("Début de l'analyse du document")
+        unavailable = {
+            'summary': 'Service d\'IA non disponible',
+            'key_points': ['Service non disponible'],
+            'model_used': self.model,
+            'error': True
+        }
         
         if not self.is_available():
-            return {
-                'summary': 'Service d\'IA non disponible',
-                'key_points': ['Service non disponible'],
-                'model_used': self.model,
-                'error': True
-            }
+            return unavailable
         
         try:
-            # Générer le résumé
-            summary = self.generate_summary(text)
+            # Document long : résumé hiérarchique couvrant tout le texte
+            if self.map_reduce and text and len(text) > self.MAX_TEXT_LENGTH:
+                text = self.reduce_text(text, deadline=deadline, refresh_cache=refresh_cache) or text
             
-            # Extraire les mots-clés
-            keywords = self.extract_keywords(text)
+            # Un seul appel au modèle pour le résumé et les mots-clés
+            result = None
+            if with_keywords and self.combined_analysis and text and len(text.strip()) >= 100:
+                result = self.generate_combined_analysis(text, deadline=deadline, refresh_cache=refresh_cache)
             
-            logger.info("Analyse du document terminée avec succès")
+            # Ollama est tombé pendant l'appel : inutile de tenter le repli
+            if result is None and not self.is_available():
+                return unavailable
+            
+            if result is None:
+                self._check_deadline(deadline)
+                result = {
+                    'summary': self.generate_summary(text, deadline=deadline, refresh_cache=refresh_cache),
+                    'key_points': None,
+                }
             
             return {
-                'summary': summary,
-                'key_points': keywords,
+                **result,
+                'text': text,
                 'model_used': self.model,
                 'error': False
             }
             
+        except DeadlineExceeded:
+            logger.warning("Budget de temps du résumé épuisé")
+            raise
         except Exception as e:
-            logger.error(f"Erreur lors de l'analyse du document: {e}")
+            logger.error(f"Erreur lors du résumé du document: {e}")
             return {
                 'summary': f'Erreur lors de l\'analyse: {str(e)}',
                 'key_points': ['Erreur d\'analyse'],
@@ -195,6 +802,101 @@ Mots-clés:"""
                 'error': True
             }
     
+    def is_business_hours(self, now: Optional[datetime] = None) -> bool:
+        """Indique si l'heure donnée (par défaut maintenant) est dans les heures ouvrées"""
+        now = timezone.localtime(now)
+        return (
+            now.isoweekday() % 7 in self.business_days
+            and self.business_start_hour <= now.hour < self.business_end_hour
+        )
+    
+    def get_keep_alive(self) -> int:
+        """
+        Durée de maintien du modèle en mémoire à demander à Ollama (secondes)
+        
+        Pendant les heures ouvrées, le modèle reste chargé jusqu'à la fin de
+        la journée : aucune analyse ne subit le temps de chargement.
+        """
+        if not self.keep_warm or not self.is_business_hours():
+            return self.keep_alive
+        
+        now = timezone.localtime()
+        end = now.replace(hour=self.business_end_hour, minute=0, second=0, microsecond=0)
+        return int((end - now).total_seconds()) + self.keep_alive
+    
+    def warm_up(self) -> Dict[str, bool]:
+        """
+        Charge le modèle en mémoire sur chaque serveur Ollama joignable
+        
+        Une requête sans prompt charge le modèle (ou prolonge son maintien
+        en mémoire) sans rien générer.
+        
+        Returns:
+            Dict URL du serveur -> modèle chargé
+        """
+        if not self.router:
+            return {}
+        
+        keep_alive = self.get_keep_alive()
+        results = {}
+        
+        for host in self.router.hosts:
+            if host.circuit_breaker.is_open:
+                results[host.url] = False
+                continue
+            
+            try:
+                start_time = time.time()
+                host.client.generate(model=self.model, prompt='', keep_alive=keep_alive)
+            except Exception as e:
+                logger.error(f"Impossible de charger le modèle {self.model} sur {host.url}: {e}")
+                if is_connection_error(e):
+                    host.circuit_breaker.record_failure()
+                results[host.url] = False
+                continue
+            
+            host.circuit_breaker.record_success()
+            host.mark_model_loaded(self.model, keep_alive)
+            results[host.url] = True
+            logger.info(f"Modèle {self.model} chargé sur {host.url} en {time.time() - start_time:.2f}s")
+        
+        return results
+    
+    def is_saturated(self, backlog: int) -> bool:
+        """
+        Indique si les serveurs Ollama sont saturés
+        
+        Args:
+            backlog: Nombre de documents en attente d'analyse
+            
+        Returns:
+            True si la file dépasse saturation_backlog documents par place
+            de traitement disponible
+        """
+        if not self.router:
+            return True
+        return backlog >= self.router.capacity * self.saturation_backlog
+    
+    def get_status(self) -> Dict:
+        """
+        État du service IA pour la supervision
+        
+        Returns:
+            Dict avec la disponibilité, l'état de chaque serveur Ollama (dont
+            les modèles chargés en mémoire), le keep_alive courant, les
+            statistiques du cache des réponses et l'activité de la
+            passerelle IA (None si elle est désactivée)
+        """
+        return {
+            'available': self.is_available(),
+            'model': self.model,
+            'hosts': self.router.stats(refresh=True) if self.router else [],
+            'keep_alive': self.get_keep_alive(),
+            'business_hours': self.is_business_hours(),
+            'response_cache': self.response_cache.stats() if self.response_cache else None,
+            'gateway': self.use_gateway() if self.gateway else None,
+        }
+    
     def generate_search_query_expansion(self, query: str) -> List[str]:
         """
         Génère des variations d'une requête de recherche pour améliorer les résultats
@@ -216,7 +918,7 @@ Requête: {query}
 Variations:"""
         
         try:
-            response = self.client.generate(
+            response = self._generate(
                 model=self.model,
                 prompt=prompt,
                 options={
@@ -238,6 +940,3 @@ Variations:"""
 
 # Instance globale du service
 ai_service = AIService()
-
-
-
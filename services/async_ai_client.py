@@ -0,0 +1,168 @@
+"""
+Client Ollama asynchrone avec nombre de requêtes simultanées borné
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+try:
+    import httpx
+    import ollama
+    OLLAMA_AVAILABLE = True
+except ImportError:
+    OLLAMA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Le budget de temps d'un appel au modèle est épuisé"""
+
+
+class AsyncOllamaPool:
+    """
+    Pool de requêtes asynchrones vers Ollama
+    
+    Un seul processus garde exactement `concurrency` requêtes en vol : un
+    sémaphore borne les appels simultanés et chaque serveur Ollama a un
+    client dont les connexions HTTP (keep-alive) sont partagées par toutes
+    les requêtes du pool. Le choix du serveur est délégué au routeur.
+    
+    Utilisation :
+        async with AsyncOllamaPool(router, concurrency=4, timeout=60) as pool:
+            results = await pool.generate_many(requests)
+    """
+    
+    def __init__(self, router, concurrency: int = 2, timeout: Optional[float] = None):
+        self.router = router
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.clients = {}
+        self._semaphore = None
+    
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        for client in self.clients.values():
+            await client._client.aclose()
+        self.clients = {}
+    
+    def _get_client(self, url: str):
+        """Client asynchrone d'un serveur, créé à la première requête"""
+        if url not in self.clients:
+            self.clients[url] = ollama.AsyncClient(
+                host=url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+            )
+        return self.clients[url]
+    
+    async def generate(self, deadline: Optional[float] = None, **kwargs) -> Dict:
+        """
+        Envoie une requête generate dès qu'une place est libre
+        
+        Args:
+            deadline: Échéance absolue (time.monotonic()) ; la requête HTTP
+                est annulée (connexion fermée, ce qui interrompt la
+                génération côté Ollama) si elle n'est pas terminée à temps
+            **kwargs: Paramètres de AsyncClient.generate
+        
+        Raises:
+            DeadlineExceeded si l'échéance est dépassée
+        """
+        async def send(host):
+            request = self._get_client(host.url).generate(**kwargs)
+            if deadline is None:
+                return await request
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                request.close()
+                raise DeadlineExceeded("Échéance dépassée avant l'envoi de la requête")
+            
+            try:
+                return await asyncio.wait_for(request, timeout=remaining)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Échéance dépassée, requête annulée") from None
+        
+        async with self._semaphore:
+            return await self.router.acall(kwargs.get('model', ''), send, kwargs.get('keep_alive'))
+    
+    async def generate_many(self, requests: List[Dict],
+                            deadline: Optional[float] = None) -> List[Union[Dict, Exception]]:
+        """
+        Envoie plusieurs requêtes en gardant au plus `concurrency` requêtes en vol
+        
+        Args:
+            requests: Paramètres de chaque requête generate
+            deadline: Échéance absolue commune à toutes les requêtes
+        
+        Returns:
+            Réponse ou exception de chaque requête, dans l'ordre des requêtes
+        """
+        return await asyncio.gather(
+            *(self.generate(deadline=deadline, **request) for request in requests),
+            return_exceptions=True
+        )
+
+
+class AsyncOllamaRunner:
+    """
+    Pool de requêtes asynchrones permanent d'un processus
+    
+    La boucle asyncio tourne dans un thread dédié et garde le même
+    AsyncOllamaPool d'un appel à l'autre : les connexions HTTP (keep-alive)
+    vers les serveurs Ollama sont réutilisées, et la borne de `concurrency`
+    requêtes en vol vaut pour tous les appels du processus, même
+    simultanés. La boucle est démarrée au premier appel, et de nouveau
+    après un fork (enfants des workers prefork).
+    
+    Utilisation depuis du code synchrone :
+        runner = AsyncOllamaRunner(router, concurrency=4, timeout=60)
+        results = runner.generate_many(requests, deadline)
+    """
+    
+    def __init__(self, router, concurrency: int = 2, timeout: Optional[float] = None):
+        self.router = router
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._pool = None
+    
+    def _start(self):
+        """Démarre la boucle et son pool dans ce processus"""
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='ollama-async', daemon=True).start()
+        self._pool = AsyncOllamaPool(self.router, self.concurrency, self.timeout)
+        asyncio.run_coroutine_threadsafe(self._pool.__aenter__(), self._loop).result()
+        self._pid = os.getpid()
+    
+    def generate_many(self, requests: List[Dict],
+                      deadline: Optional[float] = None) -> List[Union[Dict, Exception]]:
+        """
+        Exécute des requêtes generate sur le pool du processus (voir
+        AsyncOllamaPool.generate_many)
+        
+        Si l'appelant est interrompu (limite de temps de la tâche), les
+        requêtes en cours sont annulées.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+        
+        future = asyncio.run_coroutine_threadsafe(self._pool.generate_many(requests, deadline), self._loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
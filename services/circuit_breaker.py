@@ -0,0 +1,74 @@
+"""
+Disjoncteur (circuit breaker) pour les services externes
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur à trois états
+    
+    - fermé : les appels passent normalement
+    - ouvert : après failure_threshold échecs consécutifs, les appels sont
+      refusés immédiatement pendant recovery_timeout secondes
+    - semi-ouvert : une seule requête de test est autorisée ; son succès
+      referme le disjoncteur, son échec le rouvre
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow_request(self) -> bool:
+        """Indique si un appel peut être tenté maintenant"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                # Laisser passer une requête de test
+                self.state = self.HALF_OPEN
+                logger.info(f"Disjoncteur {self.name} semi-ouvert, test du service")
+                return True
+            
+            return False
+    
+    def record_success(self):
+        """Enregistre un appel réussi"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Disjoncteur {self.name} refermé")
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        """Enregistre un appel en échec"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"Disjoncteur {self.name} ouvert après {self.failures} échec(s), "
+                        f"nouvel essai dans {self.recovery_timeout}s"
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+    
+    @property
+    def is_open(self) -> bool:
+        """Vérifie si les appels sont actuellement refusés"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.recovery_timeout
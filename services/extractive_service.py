@@ -0,0 +1,181 @@
+"""
+Pré-résumé extractif local : sélection des phrases les plus informatives
+"""
+import logging
+import math
+import re
+from collections import Counter
+from typing import List
+
+from services.stopwords import tokenize
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logging.warning("NumPy not installed. Extractive pre-summarization will be disabled.")
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractiveService:
+    """
+    Réduit un document à ses phrases les plus représentatives
+    
+    Chaque phrase est pondérée par TF-IDF (les phrases du document servant
+    de corpus) et notée par sa similarité cosinus avec le centroïde du
+    document. Les meilleures phrases sont retenues dans la limite d'un
+    budget de caractères, en écartant les quasi-doublons, puis remises dans
+    l'ordre du texte. Le modèle reçoit ainsi un extrait couvrant tout le
+    document au lieu de ses premiers caractères.
+    """
+    
+    # Découpage en phrases : ponctuation finale suivie d'un espace
+    SENTENCE_PATTERN = re.compile(r'(?<=[.!?…])\s+')
+    
+    # Ligne de table des matières : points de conduite suivis d'un numéro de page
+    TOC_PATTERN = re.compile(r'(?:\.\s*){4,}\d+\s*$')
+    
+    # Numéro de page seul sur sa ligne (« 12 », « Page 12 », « - 12 - », « 12 / 40 »)
+    PAGE_NUMBER_PATTERN = re.compile(r'^(?:page\s*)?[-–\s]*\d+(?:\s*(?:/|sur|of)\s*\d+)?[-–\s]*$', re.IGNORECASE)
+    
+    # Une ligne courte répétée au moins autant de fois est un en-tête ou un pied de page
+    BOILERPLATE_MIN_REPEATS = 3
+    BOILERPLATE_MAX_LENGTH = 100
+    
+    # Longueur minimale d'une phrase retenue (en caractères)
+    MIN_SENTENCE_LENGTH = 20
+    
+    # Similarité au-delà de laquelle une phrase est un doublon d'une phrase déjà retenue
+    REDUNDANCY_THRESHOLD = 0.8
+    
+    @classmethod
+    def split_sentences(cls, text: str) -> List[str]:
+        """
+        Découpe un texte en phrases en écartant le bruit de mise en page
+        
+        Les lignes courtes répétées (en-têtes, pieds de page), les numéros
+        de page, les lignes de table des matières et les fragments trop
+        courts sont ignorés.
+        
+        Args:
+            text: Texte du document
+        
+        Returns:
+            Phrases dans l'ordre du texte
+        """
+        lines = [line.strip() for line in text.splitlines()]
+        repeats = Counter(line for line in lines if line)
+        kept_lines = [
+            line for line in lines
+            if line
+            and (repeats[line] < cls.BOILERPLATE_MIN_REPEATS or len(line) > cls.BOILERPLATE_MAX_LENGTH)
+            and not cls.PAGE_NUMBER_PATTERN.match(line)
+            and not cls.TOC_PATTERN.search(line)
+        ]
+        
+        sentences = []
+        for sentence in cls.SENTENCE_PATTERN.split(' '.join(kept_lines)):
+            sentence = sentence.strip()
+            if len(sentence) >= cls.MIN_SENTENCE_LENGTH:
+                sentences.append(sentence)
+        return sentences
+    
+    @classmethod
+    def summarize(cls, text: str, max_chars: int) -> str:
+        """
+        Sélectionne les phrases les plus informatives d'un texte
+        
+        Args:
+            text: Texte du document
+            max_chars: Budget de l'extrait en caractères
+        
+        Returns:
+            Extrait d'au plus max_chars caractères ; le texte tronqué si
+            NumPy n'est pas installé
+        """
+        if len(text) <= max_chars:
+            return text
+        
+        if not NUMPY_AVAILABLE:
+            return text[:max_chars]
+        
+        sentences = cls.split_sentences(text)
+        tokens = [tokenize(sentence) for sentence in sentences]
+        indexed = [index for index, words in enumerate(tokens) if words]
+        if not indexed:
+            return text[:max_chars]
+        
+        # Matrice creuse phrases x termes, sous forme de triplets (ligne, colonne, valeur)
+        vocabulary = {}
+        rows, columns = [], []
+        for row, index in enumerate(indexed):
+            for word in tokens[index]:
+                rows.append(row)
+                columns.append(vocabulary.setdefault(word, len(vocabulary)))
+        
+        num_rows, num_terms = len(indexed), len(vocabulary)
+        cells, counts = np.unique(
+            np.array(rows, dtype=np.int64) * num_terms + np.array(columns, dtype=np.int64),
+            return_counts=True
+        )
+        rows, columns = cells // num_terms, cells % num_terms
+        
+        # Pondération TF-IDF et normalisation de chaque phrase
+        document_frequency = np.bincount(columns, minlength=num_terms)
+        idf = np.log((1 + num_rows) / (1 + document_frequency)) + 1
+        values = np.log1p(counts) * idf[columns]
+        norms = np.sqrt(np.bincount(rows, values ** 2, minlength=num_rows))
+        values /= norms[rows]
+        
+        # Similarité cosinus de chaque phrase avec le centroïde du document
+        centroid = np.bincount(columns, values, minlength=num_terms)
+        centroid /= np.linalg.norm(centroid) or 1
+        scores = np.bincount(rows, values * centroid[columns], minlength=num_rows)
+        
+        # Vecteur creux de chaque phrase (les lignes sont triées par np.unique)
+        bounds = np.searchsorted(rows, np.arange(num_rows + 1))
+        
+        def vector(row):
+            return dict(zip(columns[bounds[row]:bounds[row + 1]].tolist(),
+                            values[bounds[row]:bounds[row + 1]].tolist()))
+        
+        selected = {}
+        used_chars = 0
+        for row in np.argsort(-scores).tolist():
+            if max_chars - used_chars < cls.MIN_SENTENCE_LENGTH:
+                break
+            sentence = sentences[indexed[row]]
+            if used_chars + len(sentence) + 1 > max_chars:
+                continue
+            candidate = vector(row)
+            if any(
+                sum(weight * other.get(term, 0.0) for term, weight in candidate.items()) > cls.REDUNDANCY_THRESHOLD
+                for other in selected.values()
+            ):
+                continue
+            selected[row] = candidate
+            used_chars += len(sentence) + 1
+        
+        if not selected:
+            return text[:max_chars]
+        
+        logger.debug(f"Pré-résumé extractif: {len(selected)}/{len(sentences)} phrases retenues")
+        return '\n'.join(sentences[indexed[row]] for row in sorted(selected))
+    
+    @staticmethod
+    def get_budget(text_length: int, ratio: float, min_chars: int, max_chars: int) -> int:
+        """
+        Budget de l'extrait selon la taille du document
+        
+        Args:
+            text_length: Longueur du document en caractères
+            ratio: Part du document conservée
+            min_chars: Budget minimal
+            max_chars: Budget maximal
+        
+        Returns:
+            Budget en caractères
+        """
+        return max(min_chars, min(max_chars, math.ceil(text_length * ratio)))
@@ -1,9 +1,12 @@
 """
 Service pour la manipulation et l'extraction de contenu des fichiers
 """
-import os
+import hashlib
 import logging
-from typing import Optional, Tuple
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 from pathlib import Path
 
 import PyPDF2
@@ -13,6 +16,18 @@ from PIL import Image
 logger = logging.getLogger(__name__)
 
 
+def _extract_pdf_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Extrait le texte des pages [start, end) d'un PDF
+    
+    Exécutée dans un processus du pool d'extraction, elle doit rester au
+    niveau du module pour pouvoir être sérialisée.
+    """
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
 class FileService:
     """Service pour la gestion et l'extraction de contenu des fichiers"""
     
@@ -23,6 +38,29 @@ class FileService:
     # Taille maximale de fichier (50 MB)
     MAX_FILE_SIZE = 50 * 1024 * 1024
     
+    # Taille des blocs lus pour le calcul des empreintes (1 MB)
+    HASH_CHUNK_SIZE = 1024 * 1024
+    
+    # Estimation du nombre de mots par page pour les formats sans pagination
+    WORDS_PER_PAGE = 500
+    
+    # Pool de processus d'extraction, créé au premier besoin et partagé
+    # par toutes les tâches du processus
+    _extraction_pool = None
+    _extraction_pool_lock = threading.Lock()
+    
+    # Signatures attendues en début de fichier
+    FILE_SIGNATURES = {
+        '.pdf': [b'%PDF'],
+        '.docx': [b'PK\x03\x04'],
+        '.doc': [b'\xd0\xcf\x11\xe0', b'PK\x03\x04'],
+        '.jpg': [b'\xff\xd8\xff'],
+        '.jpeg': [b'\xff\xd8\xff'],
+        '.png': [b'\x89PNG'],
+        '.gif': [b'GIF8'],
+        '.bmp': [b'BM'],
+    }
+    
     @classmethod
     def validate_file(cls, file) -> Tuple[bool, str]:
         """
@@ -31,15 +69,29 @@ class FileService:
         Args:
             file: Fichier Django UploadedFile
             
+        Returns:
+            Tuple (is_valid, error_message)
+        """
+        return cls.validate_file_metadata(file.name, file.size)
+    
+    @classmethod
+    def validate_file_metadata(cls, file_name: str, file_size: int) -> Tuple[bool, str]:
+        """
+        Valide le nom et la taille annoncés d'un fichier, avant d'en recevoir le contenu
+        
+        Args:
+            file_name: Nom du fichier
+            file_size: Taille du fichier en octets
+            
         Returns:
             Tuple (is_valid, error_message)
         """
         # Vérifier la taille
-        if file.size > cls.MAX_FILE_SIZE:
+        if file_size > cls.MAX_FILE_SIZE:
             return False, f"Le fichier est trop volumineux (max {cls.MAX_FILE_SIZE // (1024*1024)} MB)"
         
         # Vérifier l'extension
-        file_ext = Path(file.name).suffix.lower()
+        file_ext = Path(file_name).suffix.lower()
         all_supported = cls.SUPPORTED_DOCUMENT_TYPES + cls.SUPPORTED_IMAGE_TYPES
         
         if file_ext not in all_supported:
@@ -48,26 +100,56 @@ class FileService:
         return True, ""
     
     @classmethod
-    def extract_text_from_pdf(cls, file_path: str) -> str:
+    def validate_file_header(cls, file_name: str, header: bytes) -> Tuple[bool, str]:
         """
-        Extrait le texte d'un fichier PDF
+        Vérifie que les premiers octets d'un fichier correspondent à son extension
         
         Args:
-            file_path: Chemin vers le fichier PDF
+            file_name: Nom du fichier
+            header: Premiers octets du fichier
             
         Returns:
-            Texte extrait
+            Tuple (is_valid, error_message)
         """
-        try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text.strip()
-        except Exception as e:
-            logger.error(f"Erreur lors de l'extraction PDF: {e}")
-            return ""
+        file_ext = Path(file_name).suffix.lower()
+        signatures = cls.FILE_SIGNATURES.get(file_ext)
+        
+        if signatures and not any(header.startswith(sig) for sig in signatures):
+            return False, f"Le contenu du fichier ne correspond pas au type {file_ext}"
+        
+        return True, ""
+    
+    @classmethod
+    def iter_pages(cls, file_path: str) -> Iterator[Tuple[int, str]]:
+        """
+        Parcourt le texte d'un document page par page
+        
+        Les pages sont lues à la demande : l'appelant peut s'arrêter dès qu'il
+        a obtenu assez de texte sans que le reste du fichier soit extrait.
+        Les formats sans notion de page (DOCX, TXT) produisent une seule page.
+        
+        Args:
+            file_path: Chemin vers le fichier
+            
+        Yields:
+            Tuple (numéro de page à partir de 1, texte de la page)
+        """
+        file_ext = Path(file_path).suffix.lower()
+        
+        if file_ext == '.pdf':
+            try:
+                with open(file_path, 'rb') as file:
+                    pdf_reader = PyPDF2.PdfReader(file)
+                    for page_number, page in enumerate(pdf_reader.pages, start=1):
+                        yield page_number, page.extract_text() or ""
+            except Exception as e:
+                logger.error(f"Erreur lors de l'extraction PDF: {e}")
+        elif file_ext in ['.docx', '.doc']:
+            yield 1, cls.extract_text_from_docx(file_path)
+        elif file_ext == '.txt':
+            yield 1, cls.extract_text_from_txt(file_path)
+        else:
+            logger.warning(f"Type de fichier non supporté pour l'extraction: {file_ext}")
     
     @classmethod
     def extract_text_from_docx(cls, file_path: str) -> str:
@@ -115,56 +197,179 @@ class FileService:
             return ""
     
     @classmethod
-    def extract_text(cls, file_path: str) -> str:
+    def get_extraction_pool(cls) -> ProcessPoolExecutor:
+        """
+        Retourne le pool de processus d'extraction, en le créant au premier appel
+        
+        Les processus du pool sont créés par un serveur de fork : le worker
+        d'extraction tourne en threads, et forker un processus multithread
+        (connexions, verrous de logging tenus par d'autres threads) peut
+        bloquer les processus créés.
+        
+        Returns:
+            ProcessPoolExecutor partagé
+        """
+        from django.conf import settings
+        
+        with cls._extraction_pool_lock:
+            if cls._extraction_pool is None:
+                workers = settings.PDF_EXTRACTION_WORKERS
+                cls._extraction_pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+                logger.info(f"Pool d'extraction PDF démarré ({workers} processus)")
+            return cls._extraction_pool
+    
+    @classmethod
+    def extract_pdf_pages_parallel(cls, file_path: str) -> Optional[List[str]]:
+        """
+        Extrait les pages d'un gros PDF en parallèle par plages de pages
+        
+        Args:
+            file_path: Chemin vers le fichier PDF
+            
+        Returns:
+            Texte de chaque page dans l'ordre, ou None si le document est trop
+            petit pour justifier l'extraction parallèle ou si elle a échoué
+        """
+        from django.conf import settings
+        
+        workers = settings.PDF_EXTRACTION_WORKERS
+        if workers < 2:
+            return None
+        
+        # Enfant d'un worker prefork : un processus démon ne peut pas créer
+        # de sous-processus (le worker d'extraction tourne en threads)
+        if multiprocessing.current_process().daemon:
+            logger.debug("Processus démon : extraction PDF séquentielle")
+            return None
+        
+        try:
+            with open(file_path, 'rb') as file:
+                page_count = len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'extraction PDF: {e}")
+            return None
+        
+        if page_count < settings.PDF_PARALLEL_THRESHOLD:
+            return None
+        
+        # Deux plages par processus pour équilibrer les pages de coût inégal
+        range_size = -(-page_count // (workers * 2))
+        ranges = [
+            (start, min(start + range_size, page_count))
+            for start in range(0, page_count, range_size)
+        ]
+        
+        try:
+            pool = cls.get_extraction_pool()
+            futures = [
+                pool.submit(_extract_pdf_page_range, file_path, start, end)
+                for start, end in ranges
+            ]
+            pages = []
+            for future in futures:
+                pages.extend(future.result())
+            logger.info(f"PDF de {page_count} pages extrait en {len(ranges)} plages")
+            return pages
+        except Exception as e:
+            logger.error(f"Erreur lors de l'extraction PDF parallèle, extraction séquentielle: {e}")
+            return None
+    
+    @classmethod
+    def extract_pages(cls, file_path: str) -> List[str]:
         """
-        Extrait le texte d'un fichier selon son type
+        Extrait le texte de toutes les pages d'un document
+        
+        Les gros PDF sont extraits en parallèle, les autres documents page
+        par page dans le processus courant.
         
         Args:
             file_path: Chemin vers le fichier
             
         Returns:
-            Texte extrait
+            Texte de chaque page dans l'ordre
         """
-        file_ext = Path(file_path).suffix.lower()
+        if Path(file_path).suffix.lower() == '.pdf':
+            pages = cls.extract_pdf_pages_parallel(file_path)
+            if pages is not None:
+                return pages
         
-        if file_ext == '.pdf':
-            return cls.extract_text_from_pdf(file_path)
-        elif file_ext in ['.docx', '.doc']:
-            return cls.extract_text_from_docx(file_path)
-        elif file_ext == '.txt':
-            return cls.extract_text_from_txt(file_path)
-        else:
-            logger.warning(f"Type de fichier non supporté pour l'extraction: {file_ext}")
-            return ""
+        return [page_text for _, page_text in cls.iter_pages(file_path)]
     
     @classmethod
-    def get_page_count(cls, file_path: str) -> int:
+    def compute_file_hash(cls, file_path: str) -> str:
         """
-        Compte le nombre de pages d'un document
+        Calcule l'empreinte SHA-256 du contenu d'un fichier
         
         Args:
             file_path: Chemin vers le fichier
             
         Returns:
-            Nombre de pages (0 si non applicable)
+            Empreinte hexadécimale
         """
-        file_ext = Path(file_path).suffix.lower()
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(cls.HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+    
+    @classmethod
+    def compute_upload_hash(cls, uploaded_file) -> str:
+        """
+        Retourne l'empreinte SHA-256 d'un fichier uploadé
         
-        try:
-            if file_ext == '.pdf':
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    return len(pdf_reader.pages)
-            elif file_ext in ['.docx', '.doc']:
-                # Pour DOCX, on estime environ 500 mots par page
-                doc = DocxDocument(file_path)
-                total_words = sum(len(p.text.split()) for p in doc.paragraphs)
-                return max(1, total_words // 500)
-            else:
-                return 1  # Fichiers texte = 1 page
-        except Exception as e:
-            logger.error(f"Erreur lors du comptage des pages: {e}")
-            return 0
+        L'empreinte calculée pendant l'upload est réutilisée si elle existe.
+        
+        Args:
+            uploaded_file: Fichier Django UploadedFile
+            
+        Returns:
+            Empreinte hexadécimale
+        """
+        content_hash = getattr(uploaded_file, 'content_hash', None)
+        if content_hash:
+            return content_hash
+        
+        sha256 = hashlib.sha256()
+        for chunk in uploaded_file.chunks(cls.HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+        uploaded_file.seek(0)
+        return sha256.hexdigest()
+    
+    @classmethod
+    def extract_document(cls, file_path: str) -> dict:
+        """
+        Extrait en une seule lecture le texte, le nombre de pages et la
+        position de chaque page dans le texte
+        
+        Args:
+            file_path: Chemin vers le fichier
+            
+        Returns:
+            Dictionnaire avec text, page_count et page_offsets
+        """
+        parts = cls.extract_pages(file_path)
+        page_offsets = []
+        offset = 0
+        
+        for page_text in parts:
+            page_offsets.append(offset)
+            offset += len(page_text) + 1
+        
+        text = "\n".join(parts)
+        page_count = len(parts)
+        
+        # Pour DOCX, on estime environ 500 mots par page
+        if Path(file_path).suffix.lower() in ['.docx', '.doc'] and parts:
+            page_count = max(1, len(text.split()) // cls.WORDS_PER_PAGE)
+        
+        return {
+            'text': text,
+            'page_count': page_count,
+            'page_offsets': page_offsets,
+        }
     
     @classmethod
     def generate_snippet(cls, text: str, max_length: int = 200) -> str:
@@ -195,34 +400,3 @@ class FileService:
             snippet = snippet[:last_space]
         
         return snippet + "..."
-    
-    @classmethod
-    def get_file_info(cls, file_path: str) -> dict:
-        """
-        Récupère les informations d'un fichier
-        
-        Args:
-            file_path: Chemin vers le fichier
-            
-        Returns:
-            Dictionnaire avec les informations du fichier
-        """
-        try:
-            file_stat = os.stat(file_path)
-            file_ext = Path(file_path).suffix.lower()
-            
-            return {
-                'size': file_stat.st_size,
-                'extension': file_ext,
-                'page_count': cls.get_page_count(file_path),
-            }
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération des infos du fichier: {e}")
-            return {
-                'size': 0,
-                'extension': '',
-                'page_count': 0,
-            }
-
-
-
@@ -0,0 +1,64 @@
+"""
+Extraction locale de mots-clés (sans appel au modèle)
+"""
+import math
+from collections import Counter
+from typing import Dict, List
+
+from services.stopwords import tokenize
+
+
+class KeywordService:
+    """
+    Extraction de mots-clés par pondération BM25 sur le corpus des documents
+    
+    Un terme est d'autant plus représentatif d'un document qu'il y est
+    fréquent (fréquence saturée, comme dans BM25) et rare dans le reste du
+    corpus (IDF calculée à partir des fréquences documentaires).
+    """
+    
+    # Saturation de la fréquence d'un terme (paramètre k1 de BM25)
+    K1 = 1.2
+    
+    # Un terme moins fréquent dans le document n'est retenu qu'en dernier recours
+    MIN_TERM_COUNT = 2
+    
+    @staticmethod
+    def get_terms(text: str) -> Counter:
+        """
+        Occurrences des termes significatifs d'un texte
+        
+        Args:
+            text: Texte du document
+        
+        Returns:
+            Counter terme -> nombre d'occurrences
+        """
+        return Counter(tokenize(text))
+    
+    @classmethod
+    def extract_keywords(cls, term_counts: Counter, document_frequencies: Dict[str, int],
+                         total_documents: int, num_keywords: int = 7) -> List[str]:
+        """
+        Sélectionne les termes les plus caractéristiques d'un document
+        
+        Args:
+            term_counts: Occurrences des termes du document (get_terms)
+            document_frequencies: Nombre de documents du corpus contenant chaque terme
+            total_documents: Nombre de documents du corpus
+            num_keywords: Nombre de mots-clés à extraire
+        
+        Returns:
+            Liste de mots-clés, du plus au moins caractéristique
+        """
+        scores = {}
+        for term, count in term_counts.items():
+            frequency = document_frequencies.get(term, 0)
+            idf = math.log(1 + (total_documents - frequency + 0.5) / (frequency + 0.5))
+            scores[term] = idf * count * (cls.K1 + 1) / (count + cls.K1)
+        
+        # Les termes rares dans le document ne complètent la liste qu'en dernier recours
+        return sorted(
+            scores,
+            key=lambda term: (term_counts[term] < cls.MIN_TERM_COUNT, -scores[term], term)
+        )[:num_keywords]
@@ -0,0 +1,172 @@
+"""
+Cache des réponses du modèle de langage (mémoire locale + Redis)
+"""
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    Cache à deux niveaux des réponses d'Ollama
+    
+    - niveau 1 : LRU en mémoire du processus, borné à max_entries entrées
+    - niveau 2 : cache Django partagé (Redis), borné par le TTL et la
+      politique d'éviction de Redis
+    
+    Les clés sont dérivées du modèle, du prompt et des options de génération.
+    Les compteurs de hits/miss sont tenus localement et ajoutés aux totaux
+    partagés (Redis) au plus toutes les STATS_FLUSH_INTERVAL secondes : une
+    lecture servie par le niveau 1 ne fait aucun appel à Redis.
+    """
+    
+    KEY_PREFIX = 'ai:response'
+    STATS_PREFIX = 'ai:response:stats'
+    STATS_NAMES = ['local_hits', 'remote_hits', 'misses']
+    # Intervalle d'envoi des compteurs vers les totaux partagés (secondes)
+    STATS_FLUSH_INTERVAL = 10
+    
+    def __init__(self, ttl: int, max_entries: int, cache_alias: str = 'default'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_alias = cache_alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(self.STATS_NAMES, 0)
+        self._unflushed = dict.fromkeys(self.STATS_NAMES, 0)
+        self._flushed_at = time.monotonic()
+    
+    @property
+    def backend(self):
+        return caches[self.cache_alias]
+    
+    @classmethod
+    def make_key(cls, model: str, prompt: str, **params) -> str:
+        """
+        Construit la clé d'une requête
+        
+        Args:
+            model: Nom du modèle
+            prompt: Prompt envoyé
+            **params: Autres paramètres influant sur la réponse (options, format...)
+        """
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        params_hash = hashlib.sha256(
+            json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:16]
+        return f"{cls.KEY_PREFIX}:{model}:{prompt_hash}:{params_hash}"
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Retourne la réponse en cache, ou None"""
+        now = time.monotonic()
+        value = None
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._local.move_to_end(key)
+                else:
+                    del self._local[key]
+                    value = None
+        
+        if value is not None:
+            self._count('local_hits')
+            return value
+        
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Cache des réponses IA indisponible: {e}")
+            value = None
+        
+        if value is None:
+            self._count('misses')
+            return None
+        
+        self._store_local(key, value)
+        self._count('remote_hits')
+        return value
+    
+    def set(self, key: str, value: Dict):
+        """Enregistre une réponse dans les deux niveaux"""
+        self._store_local(key, value)
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Cache des réponses IA indisponible: {e}")
+    
+    def _store_local(self, key: str, value: Dict):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+    
+    def _count(self, name: str):
+        """Incrémente un compteur local ; le total partagé est mis à jour par lots"""
+        with self._lock:
+            self._stats[name] += 1
+            self._unflushed[name] += 1
+            if time.monotonic() - self._flushed_at < self.STATS_FLUSH_INTERVAL:
+                return
+            counts = self._take_unflushed()
+        self._flush(counts)
+    
+    def _take_unflushed(self) -> Dict[str, int]:
+        """Retire les compteurs pas encore envoyés (verrou _lock tenu)"""
+        counts = {name: count for name, count in self._unflushed.items() if count}
+        self._unflushed = dict.fromkeys(self.STATS_NAMES, 0)
+        self._flushed_at = time.monotonic()
+        return counts
+    
+    def _flush(self, counts: Dict[str, int]):
+        """Ajoute des compteurs aux totaux partagés"""
+        for name, count in counts.items():
+            key = f"{self.STATS_PREFIX}:{name}"
+            try:
+                try:
+                    self.backend.incr(key, count)
+                except ValueError:
+                    # Premier envoi : le total n'existe pas encore
+                    if not self.backend.add(key, count, None):
+                        self.backend.incr(key, count)
+            except Exception:
+                pass
+    
+    def stats(self) -> Dict:
+        """
+        Compteurs du cache
+        
+        Returns:
+            Dict avec les compteurs du processus (local) et les totaux
+            de tous les processus (shared), ainsi que la taille du niveau 1
+        """
+        with self._lock:
+            local = dict(self._stats)
+            local_entries = len(self._local)
+            counts = self._take_unflushed()
+        self._flush(counts)
+        
+        try:
+            values = self.backend.get_many([f"{self.STATS_PREFIX}:{name}" for name in self.STATS_NAMES])
+            shared = {name: values.get(f"{self.STATS_PREFIX}:{name}", 0) for name in self.STATS_NAMES}
+        except Exception as e:
+            logger.warning(f"Cache des réponses IA indisponible: {e}")
+            shared = None
+        
+        return {
+            'local': local,
+            'shared': shared,
+            'local_entries': local_entries,
+            'max_local_entries': self.max_entries,
+            'ttl': self.ttl,
+        }
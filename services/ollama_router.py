@@ -0,0 +1,315 @@
+"""
+Répartition des requêtes entre plusieurs serveurs Ollama
+"""
+import logging
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from services.circuit_breaker import CircuitBreaker
+
+try:
+    import httpx
+    import ollama
+    OLLAMA_AVAILABLE = True
+except ImportError:
+    OLLAMA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Distingue une panne d'un serveur Ollama d'une erreur propre à la requête"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return False
+
+
+class OllamaHost:
+    """
+    Serveur Ollama et son état vu par ce processus
+    
+    Chaque serveur a son propre disjoncteur : un serveur en panne est écarté
+    de la répartition, puis réadmis après une requête de test réussie.
+    """
+    
+    def __init__(self, url: str, failure_threshold: int, recovery_timeout: float,
+                 timeout: Optional[float] = None):
+        self.url = url
+        self.timeout = timeout
+        self.client = ollama.Client(host=url, timeout=timeout) if OLLAMA_AVAILABLE else None
+        self.circuit_breaker = CircuitBreaker(
+            f'ollama {url}',
+            failure_threshold=failure_threshold,
+            recovery_timeout=recovery_timeout,
+        )
+        # Requêtes en cours envoyées par ce processus
+        self.outstanding = 0
+        self.last_healthy_at = 0.0
+        # Modèle -> fin de maintien en mémoire (monotonic)
+        self.models_loaded_until = {}
+    
+    def mark_model_loaded(self, model: str, keep_alive: float):
+        """Enregistre qu'un modèle vient de servir et reste chargé keep_alive secondes"""
+        self.models_loaded_until[model] = math.inf if keep_alive < 0 else time.monotonic() + keep_alive
+    
+    def has_model_loaded(self, model: str) -> bool:
+        """Le modèle est (vraisemblablement) encore chargé en mémoire"""
+        return self.models_loaded_until.get(model, 0.0) > time.monotonic()
+    
+    def loaded_models(self) -> List[str]:
+        """Modèles supposés chargés sur ce serveur"""
+        return sorted(model for model in self.models_loaded_until if self.has_model_loaded(model))
+    
+    def refresh_loaded_models(self) -> Optional[List[Dict]]:
+        """
+        Interroge le serveur (/api/ps) sur les modèles chargés en mémoire
+        
+        Returns:
+            Liste des modèles chargés (name, size_vram, expires_at), ou None
+            si le serveur ne répond pas ou ne connaît pas /api/ps
+        """
+        try:
+            response = self.client._client.get('/api/ps')
+            response.raise_for_status()
+            models = response.json().get('models') or []
+        except Exception as e:
+            logger.debug(f"Modèles chargés indisponibles pour {self.url}: {e}")
+            return None
+        
+        now = datetime.now(timezone.utc)
+        loaded_until = {}
+        for model in models:
+            try:
+                # Ollama renvoie des nanosecondes : datetime n'accepte que des microsecondes
+                expires_at = re.sub(r'(\.\d{6})\d+', r'\1', model['expires_at'])
+                remaining = (datetime.fromisoformat(expires_at) - now).total_seconds()
+            except (KeyError, TypeError, ValueError):
+                remaining = 0
+            loaded_until[model.get('name', '')] = time.monotonic() + max(remaining, 0)
+        self.models_loaded_until = loaded_until
+        
+        return [
+            {
+                'name': model.get('name', ''),
+                'size_vram': model.get('size_vram'),
+                'expires_at': model.get('expires_at'),
+            }
+            for model in models
+        ]
+
+
+class OllamaRouter:
+    """
+    Répartiteur de requêtes entre serveurs Ollama
+    
+    Une requête est envoyée au serveur sain qui a le moins de requêtes en
+    cours, en privilégiant les serveurs qui ont déjà le modèle en mémoire
+    tant qu'ils ont une place libre (host_slots requêtes simultanées). Un
+    serveur qui ne répond plus est écarté par son disjoncteur et la requête
+    est relancée sur un autre serveur.
+    
+    Les requêtes en cours sont comptées par processus : un worker prefork
+    n'en a souvent qu'une à la fois, et tous les serveurs sont alors à
+    égalité. L'égalité est tranchée au hasard, pour que les processus ne
+    choisissent pas tous le premier serveur (puis le gardent, le modèle y
+    étant chargé).
+    """
+    
+    def __init__(self, urls: List[str], failure_threshold: int = 3, recovery_timeout: float = 30,
+                 host_slots: int = 1, keep_alive: float = 300, timeout: Optional[float] = None):
+        self.hosts = [
+            OllamaHost(url, failure_threshold, recovery_timeout, timeout)
+            for url in urls
+        ]
+        self.host_slots = host_slots
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self) -> bool:
+        """Aucun serveur ne peut recevoir de requête"""
+        return all(host.circuit_breaker.is_open for host in self.hosts)
+    
+    @property
+    def capacity(self) -> int:
+        """Nombre de requêtes simultanées que les serveurs sains peuvent traiter"""
+        healthy = [host for host in self.hosts if not host.circuit_breaker.is_open]
+        return len(healthy) * self.host_slots
+    
+    def acquire(self, model: str) -> Optional[OllamaHost]:
+        """
+        Choisit le serveur qui traitera une requête et la compte comme en cours
+        
+        Args:
+            model: Modèle demandé
+        
+        Returns:
+            Serveur choisi, ou None si tous les serveurs sont écartés
+        """
+        with self._lock:
+            host = self._select(model)
+            if host is not None:
+                host.outstanding += 1
+            return host
+    
+    def _select(self, model: str) -> Optional[OllamaHost]:
+        # Réadmission : un serveur écarté depuis assez longtemps reçoit la
+        # requête comme test
+        for host in self.hosts:
+            breaker = host.circuit_breaker
+            if breaker.state == CircuitBreaker.OPEN and not breaker.is_open and breaker.allow_request():
+                return host
+        
+        healthy = [host for host in self.hosts if host.circuit_breaker.state == CircuitBreaker.CLOSED]
+        if not healthy:
+            return None
+        
+        warm = [
+            host for host in healthy
+            if host.has_model_loaded(model) and host.outstanding < self.host_slots
+        ]
+        candidates = warm or healthy
+        least = min(host.outstanding for host in candidates)
+        return random.choice([host for host in candidates if host.outstanding == least])
+    
+    def release(self, host: OllamaHost, model: str, error: Optional[Exception] = None,
+                keep_alive: Optional[float] = None):
+        """
+        Termine une requête et met à jour l'état du serveur
+        
+        Args:
+            host: Serveur qui a traité la requête
+            model: Modèle demandé
+            error: Exception levée par la requête, None si elle a réussi
+            keep_alive: Durée de maintien du modèle demandée par la requête
+        """
+        with self._lock:
+            host.outstanding -= 1
+        
+        breaker = host.circuit_breaker
+        if error is None:
+            host.last_healthy_at = time.monotonic()
+            host.mark_model_loaded(model, self.keep_alive if keep_alive is None else keep_alive)
+            breaker.record_success()
+        elif is_connection_error(error):
+            host.last_healthy_at = 0.0
+            breaker.record_failure()
+        elif isinstance(error, ollama.ResponseError):
+            # Le serveur a répondu : il est joignable
+            breaker.record_success()
+        elif breaker.state == CircuitBreaker.HALF_OPEN:
+            # Requête de test sans verdict (échéance dépassée) : nouvel essai plus tard
+            breaker.record_failure()
+    
+    def call(self, model: str, func: Callable[[OllamaHost], Dict],
+             keep_alive: Optional[float] = None) -> Dict:
+        """
+        Exécute une requête sur un serveur, en basculant sur un autre en cas de panne
+        
+        Args:
+            model: Modèle demandé
+            func: Fonction qui envoie la requête au serveur reçu en paramètre
+            keep_alive: Durée de maintien du modèle demandée par la requête
+        
+        Raises:
+            ConnectionError si aucun serveur n'est disponible, ou la dernière
+            erreur de connexion rencontrée
+        """
+        error = None
+        for _ in range(len(self.hosts)):
+            host = self.acquire(model)
+            if host is None:
+                break
+            try:
+                result = func(host)
+            except Exception as e:
+                self.release(host, model, e)
+                if not is_connection_error(e):
+                    raise
+                logger.warning(f"Serveur Ollama {host.url} injoignable: {e}")
+                error = e
+                continue
+            self.release(host, model, keep_alive=keep_alive)
+            return result
+        
+        raise error or ConnectionError("Service Ollama indisponible (aucun serveur disponible)")
+    
+    async def acall(self, model: str, func: Callable, keep_alive: Optional[float] = None) -> Dict:
+        """Équivalent asynchrone de call() : func renvoie une coroutine"""
+        error = None
+        for _ in range(len(self.hosts)):
+            host = self.acquire(model)
+            if host is None:
+                break
+            try:
+                result = await func(host)
+            except Exception as e:
+                self.release(host, model, e)
+                if not is_connection_error(e):
+                    raise
+                logger.warning(f"Serveur Ollama {host.url} injoignable: {e}")
+                error = e
+                continue
+            self.release(host, model, keep_alive=keep_alive)
+            return result
+        
+        raise error or ConnectionError("Service Ollama indisponible (aucun serveur disponible)")
+    
+    def is_available(self, health_ttl: float) -> bool:
+        """
+        Vérifie qu'au moins un serveur répond
+        
+        Un serveur qui a répondu depuis moins de health_ttl secondes n'est
+        pas interrogé de nouveau ; les serveurs écartés ne sont interrogés
+        qu'une fois leur délai de réadmission écoulé.
+        """
+        now = time.monotonic()
+        for host in self.hosts:
+            if host.circuit_breaker.state == CircuitBreaker.CLOSED and now - host.last_healthy_at < health_ttl:
+                return True
+        
+        available = False
+        for host in self.hosts:
+            if not host.circuit_breaker.allow_request():
+                continue
+            try:
+                host.client.list()
+            except Exception as e:
+                logger.error(f"Serveur Ollama {host.url} non disponible: {e}")
+                host.last_healthy_at = 0.0
+                host.circuit_breaker.record_failure()
+                continue
+            host.last_healthy_at = time.monotonic()
+            host.circuit_breaker.record_success()
+            available = True
+        
+        return available
+    
+    def stats(self, refresh: bool = False) -> List[Dict]:
+        """
+        État de chaque serveur
+        
+        Args:
+            refresh: Interroger les serveurs joignables sur les modèles
+                réellement chargés en mémoire
+        """
+        stats = []
+        for host in self.hosts:
+            models = None
+            if refresh and not host.circuit_breaker.is_open:
+                models = host.refresh_loaded_models()
+            stats.append({
+                'url': host.url,
+                'circuit_breaker': host.circuit_breaker.state,
+                'outstanding': host.outstanding,
+                'loaded_models': host.loaded_models(),
+                'models': models,
+            })
+        return stats
@@ -0,0 +1,46 @@
+"""
+Mots vides (stopwords) français et anglais et découpage du texte en mots
+"""
+import re
+from typing import List
+
+FRENCH_STOPWORDS = frozenset("""
+a à afin ai aie aient ainsi alors après as au aucun aucune aujourd aussi autre autres aux avaient
+avais avait avant avec avez aviez avions avoir avons ayant b c ça car ce ceci cela celle celles
+celui cependant ces cet cette ceux chaque chez ci comme comment d dans de des donc dont du elle
+elles en encore entre es est et étaient étais était été être eu eux fait faire fois font hors
+ici il ils j je jusqu l la le les leur leurs lors lorsque lui m ma mais me même mêmes mes moi
+moins mon n ne ni non nos notre nous on ont ou où par parce pas peu peut peuvent plus pour
+pourquoi qu quand que quel quelle quelles quels qui quoi s sa sans se selon ses seulement si
+sien soit son sont sous suis sur t ta tandis te tes toi ton tous tout toute toutes très tu un une
+vers via voici voilà vos votre vous y
+""".split())
+
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before
+being below between both but by can could did do does doing down during each few for from
+further had has have having he her here hers herself him himself his how i if in into is it its
+itself just may me might more most must my myself no nor not now of off on once only or other
+our ours ourselves out over own same shall she should so some such than that the their theirs
+them themselves then there these they this those through to too under until up upon us very
+was we were what when where which while who whom why will with would you your yours yourself
+yourselves
+""".split())
+
+STOPWORDS = FRENCH_STOPWORDS | ENGLISH_STOPWORDS
+
+# Mots d'au moins trois lettres (lettres accentuées et tirets internes compris)
+WORD_PATTERN = re.compile(r"[^\W\d_](?:[^\W\d_]|-(?=[^\W\d_])){2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en mots significatifs
+    
+    Args:
+        text: Texte à découper
+    
+    Returns:
+        Mots en minuscules, sans les mots vides
+    """
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
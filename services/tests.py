@@ -0,0 +1,31 @@
+"""
+Tests des services
+"""
+from django.test import SimpleTestCase
+
+from services.ollama_router import OllamaRouter
+
+
+class OllamaRouterTests(SimpleTestCase):
+    """Répartition des requêtes entre serveurs Ollama"""
+    
+    URLS = ['http://ollama-1:11434', 'http://ollama-2:11434']
+    
+    def test_idle_hosts_share_requests(self):
+        # Un routeur par processus prefork, une requête en cours au plus
+        # chacun : tous les compteurs sont à égalité
+        served = set()
+        for _ in range(20):
+            router = OllamaRouter(self.URLS)
+            served.add(router.call('mistral:7b', lambda host: host.url))
+        
+        self.assertEqual(served, set(self.URLS))
+    
+    def test_busy_host_is_avoided(self):
+        router = OllamaRouter(self.URLS)
+        busy = router.acquire('mistral:7b')
+        
+        for _ in range(10):
+            idle = router.acquire('mistral:7b')
+            self.assertIsNot(idle, busy)
+            router.release(idle, 'mistral:7b')
@@ -0,0 +1,246 @@
+"""
+Service d'upload par morceaux avec reprise et calcul d'empreinte incrémental
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+from services.file_service import FileService
+
+logger = logging.getLogger(__name__)
+
+
+class PartUploadedFile(UploadedFile):
+    """
+    Fichier partiel d'un upload terminé
+    
+    Comme pour un TemporaryUploadedFile, le stockage local déplace le
+    fichier au lieu de le recopier.
+    """
+    
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class UploadService:
+    """Service pour les uploads de gros fichiers découpés en morceaux"""
+    
+    # Taille des blocs lus depuis la requête (64 KB)
+    READ_BLOCK_SIZE = 64 * 1024
+    
+    # Empreintes en cours par session : {session_id: (sha256, octets hachés,
+    # dernier morceau)}. Propres au processus ; si un morceau arrive sur un
+    # autre processus, l'empreinte est recalculée depuis le fichier à la
+    # finalisation. Celles des uploads abandonnés sont écartées à l'ouverture
+    # d'un nouvel upload.
+    _hashers = {}
+    _hashers_lock = threading.Lock()
+    
+    @classmethod
+    def get_part_path(cls, session) -> str:
+        """Chemin du fichier partiel d'une session"""
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{session.id}.part")
+    
+    @classmethod
+    def write_chunk(cls, session, offset: int, stream, length: int) -> Tuple[bool, str, Optional[object]]:
+        """
+        Écrit un morceau à sa place dans le fichier partiel d'une session
+        
+        Appelée sans verrou : la lecture de la requête peut durer, le morceau
+        n'est compté qu'à son enregistrement par commit_chunk. Les octets
+        écrits au-delà de la taille reçue (morceau interrompu) sont ignorés
+        puis écrasés par le renvoi du morceau.
+        
+        Le premier morceau est contrôlé (signature du type de fichier) avant
+        d'être écrit.
+        
+        Args:
+            session: UploadSession
+            offset: Position du morceau dans le fichier
+            stream: Flux de la requête contenant le morceau
+            length: Taille du morceau en octets
+        
+        Returns:
+            Tuple (is_valid, error_message, sha256) ; sha256 est l'empreinte
+            incrémentale prolongée par le morceau, ou None si elle n'est pas
+            disponible dans ce processus
+        """
+        os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+        
+        with cls._hashers_lock:
+            if offset == 0:
+                cls._prune_hashers()
+                sha256, hashed = hashlib.sha256(), 0
+            else:
+                sha256, hashed, _ = cls._hashers.get(session.id, (None, None, None))
+            # Copie : l'empreinte partagée n'avance qu'à l'enregistrement
+            sha256 = sha256.copy() if sha256 is not None and hashed == offset else None
+        
+        remaining = length
+        check_header = offset == 0
+        # Ouverture sans troncature : les octets déjà reçus restent en place
+        fd = os.open(cls.get_part_path(session), os.O_WRONLY | os.O_CREAT, 0o666)
+        with open(fd, 'wb') as part:
+            part.seek(offset)
+            while remaining > 0:
+                block = stream.read(min(cls.READ_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                
+                if check_header:
+                    is_valid, error = FileService.validate_file_header(session.filename, block)
+                    if not is_valid:
+                        return False, error, None
+                    check_header = False
+                
+                part.write(block)
+                if sha256 is not None:
+                    sha256.update(block)
+                remaining -= len(block)
+        
+        if remaining:
+            return False, "Morceau incomplet, veuillez le renvoyer", None
+        
+        return True, "", sha256
+    
+    @classmethod
+    def commit_chunk(cls, session, offset: int, length: int, sha256) -> bool:
+        """
+        Enregistre un morceau écrit par write_chunk
+        
+        Args:
+            session: UploadSession verrouillée par l'appelant
+            offset: Position du morceau dans le fichier
+            length: Taille du morceau en octets
+            sha256: Empreinte renvoyée par write_chunk
+        
+        Returns:
+            False si le morceau ne suit pas les octets déjà reçus
+        """
+        if offset + length <= session.received_size:
+            # Morceau déjà enregistré par une requête concurrente : ses octets
+            # viennent d'être réécrits, l'empreinte sera recalculée depuis le
+            # fichier à la finalisation
+            with cls._hashers_lock:
+                cls._hashers.pop(session.id, None)
+            return True
+        
+        if offset != session.received_size:
+            return False
+        
+        session.received_size = offset + length
+        session.save(update_fields=['received_size', 'updated_at'])
+        
+        with cls._hashers_lock:
+            if sha256 is not None:
+                cls._hashers[session.id] = (sha256, session.received_size, time.monotonic())
+            else:
+                cls._hashers.pop(session.id, None)
+        
+        return True
+    
+    @classmethod
+    def _prune_hashers(cls):
+        """Écarte les empreintes des uploads abandonnés (verrou _hashers_lock tenu)"""
+        expired_before = time.monotonic() - settings.UPLOAD_SESSION_TTL_HOURS * 3600
+        for session_id, (_, _, touched_at) in list(cls._hashers.items()):
+            if touched_at < expired_before:
+                del cls._hashers[session_id]
+    
+    @classmethod
+    def get_content_hash(cls, session) -> str:
+        """
+        Empreinte SHA-256 du fichier reçu
+        
+        Utilise l'empreinte calculée au fil des morceaux si elle couvre tout
+        le fichier, sinon relit le fichier partiel.
+        """
+        with cls._hashers_lock:
+            sha256, hashed, _ = cls._hashers.pop(session.id, (None, None, None))
+        
+        if sha256 is not None and hashed == session.total_size:
+            return sha256.hexdigest()
+        
+        return FileService.compute_file_hash(cls.get_part_path(session))
+    
+    @classmethod
+    def open_uploaded_file(cls, session) -> UploadedFile:
+        """
+        Ouvre le fichier reçu sous forme de fichier uploadé Django
+        
+        Enregistré sur le stockage local, le fichier partiel est déplacé vers
+        son emplacement définitif ; les autres stockages le lisent par blocs.
+        
+        Returns:
+            UploadedFile portant l'empreinte du contenu (content_hash)
+        """
+        uploaded_file = PartUploadedFile(
+            file=open(cls.get_part_path(session), 'rb'),
+            name=os.path.basename(session.filename),
+            size=session.total_size,
+        )
+        uploaded_file.content_hash = cls.get_content_hash(session)
+        return uploaded_file
+    
+    @classmethod
+    def discard(cls, session):
+        """Supprime le fichier partiel d'une session"""
+        with cls._hashers_lock:
+            cls._hashers.pop(session.id, None)
+        
+        try:
+            os.remove(cls.get_part_path(session))
+        except FileNotFoundError:
+            pass
+    
+    @classmethod
+    def cleanup_expired(cls) -> int:
+        """
+        Supprime les uploads abandonnés et leurs fichiers partiels
+        
+        Sont supprimés les uploads inachevés sans nouveau morceau depuis
+        UPLOAD_SESSION_TTL_HOURS heures, ainsi que les fichiers partiels aussi
+        anciens qui n'appartiennent plus à aucun upload (session supprimée
+        avec son propriétaire, par exemple).
+        
+        Returns:
+            Nombre d'uploads supprimés
+        """
+        from apps.documents.models import UploadSession
+        
+        expired = 0
+        for session in UploadSession.get_expired().iterator():
+            cls.discard(session)
+            session.delete()
+            expired += 1
+        
+        try:
+            part_names = os.listdir(settings.CHUNKED_UPLOAD_DIR)
+        except FileNotFoundError:
+            part_names = []
+        
+        expired_before = time.time() - settings.UPLOAD_SESSION_TTL_HOURS * 3600
+        active_ids = {
+            str(session_id) for session_id in
+            UploadSession.objects.exclude(status=UploadSession.STATUS_COMPLETED).values_list('id', flat=True)
+        }
+        for name in part_names:
+            path = os.path.join(settings.CHUNKED_UPLOAD_DIR, name)
+            session_id, extension = os.path.splitext(name)
+            if extension != '.part' or session_id in active_ids:
+                continue
+            try:
+                if os.path.getmtime(path) < expired_before:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        
+        if expired:
+            logger.info(f"{expired} upload(s) abandonné(s) supprimé(s)")
+        return expired
@@ -0,0 +1,45 @@
+"""
+Gestionnaires d'upload calculant l'empreinte du fichier pendant la réception
+"""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler, TemporaryFileUploadHandler
+)
+
+
+class ContentHashMixin:
+    """
+    Calcule l'empreinte SHA-256 des blocs conservés par le gestionnaire
+    
+    Le fichier produit expose l'empreinte dans son attribut content_hash,
+    ce qui évite de relire le fichier après l'upload.
+    """
+    
+    def new_file(self, *args, **kwargs):
+        # Initialisé avant l'appel parent, qui peut lever StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+    
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        
+        # None signifie que ce gestionnaire a conservé le bloc
+        if data is None:
+            self.sha256.update(raw_data)
+        
+        return data
+    
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    """Upload en mémoire (petits fichiers) avec calcul d'empreinte"""
+
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    """Upload en fichier temporaire (gros fichiers) avec calcul d'empreinte"""